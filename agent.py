@@ -1,53 +1,289 @@
 from langchain_aws import ChatBedrock
-from langchain.memory import ConversationBufferMemory
-from langchain.schema import SystemMessage, HumanMessage, BaseMessage
-from jinja2 import Environment, BaseLoader
-from datetime import datetime
+from langchain_core.messages import SystemMessage, HumanMessage, BaseMessage
 from dotenv import load_dotenv
+import asyncio
+import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from content_loader import ContentLoader
+from conversation_memory import ConversationMemory, estimate_tokens
+from field_cache import FIELD_CONTEXT_PROMPT, FieldContextCache, LRUCacheBackend, SQLiteCacheBackend
+from schema_index import SchemaIndex, render_field_context, render_field_updated
+from prompt_builder import PromptBuilder, content_text
+from retrieval import load_or_build
+from form_updates import FORM_UPDATE_TOOL, parse_reply
+from llm_gateway import LLMGateway
+from session_store import RedisSessionBackend, SessionStore, SQLiteSessionBackend
+import metrics
+from logging_setup import setup_logging
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Global memory instances per session
-_memories = {}
+logger = logging.getLogger(__name__)
+
+# Conversation memory limits: recent turns kept verbatim, older ones summarized
+MEMORY_MAX_TURNS = int(os.getenv("MEMORY_MAX_TURNS", "6"))
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1500"))
+
+
+def new_memory():
+    """Create empty conversation memory for a session."""
+    return ConversationMemory(max_turns=MEMORY_MAX_TURNS, max_tokens=MEMORY_TOKEN_BUDGET)
+
+
+# Where session state lives: "memory" (this process only), "sqlite" (a file
+# shared by the workers on one host) or "redis" (shared by every node).
+# Multi-worker deployments need one of the shared backends.
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_SQLITE_PATH = os.getenv("STATE_SQLITE_PATH", "state.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+def create_state_backend():
+    """Shared session backend for STATE_BACKEND, or None for in-process state."""
+    if STATE_BACKEND == "sqlite":
+        return SQLiteSessionBackend(STATE_SQLITE_PATH)
+    if STATE_BACKEND == "redis":
+        return RedisSessionBackend(REDIS_URL)
+    if STATE_BACKEND != "memory":
+        raise ValueError(f"Unknown STATE_BACKEND '{STATE_BACKEND}' (expected memory, sqlite or redis)")
+    return None
+
+
+# Per-session state (memory + form data), bounded by LRU/TTL eviction.
+# Set SESSION_SPILL_PATH (e.g. sessions.db) to park evicted sessions on disk.
+_sessions = SessionStore(
+    max_sessions=int(os.getenv("SESSION_MAX_IN_MEMORY", "500")),
+    ttl_seconds=float(os.getenv("SESSION_TTL_SECONDS", "1800")),
+    spill_path=os.getenv("SESSION_SPILL_PATH") or None,
+    memory_factory=new_memory,
+    backend=create_state_backend(),
+)
+
+# Prompt size accounting. "baseline" is what the same turns would have cost
+# if the full, unsummarized history were resent every time.
+_token_stats = {
+    "turns": 0,
+    "prompt_tokens": 0,
+    "baseline_prompt_tokens": 0,
+    "summary_calls": 0,
+    "summary_tokens": 0,
+    "reported_input_tokens": 0,
+}
+
+LLM_SECONDS = metrics.histogram("llm_request_duration_seconds", "Duration of LLM calls", ["kind"])
+LLM_ERRORS = metrics.counter("llm_errors_total", "LLM calls that failed or timed out", ["kind", "error"])
+LLM_INPUT_TOKENS = metrics.counter(
+    "llm_input_tokens_total", "Input tokens (reported by the model, else estimated)", ["kind"])
+LLM_OUTPUT_TOKENS = metrics.counter(
+    "llm_output_tokens_total", "Output tokens (reported by the model, else estimated)", ["kind"])
+PROMPT_TOKENS = metrics.histogram(
+    "llm_prompt_tokens", "Estimated prompt tokens per conversation turn", buckets=metrics.TOKEN_BUCKETS)
+HISTORY_TOKENS = metrics.histogram(
+    "session_history_tokens", "Estimated tokens of a session's summary and recent turns after each turn",
+    buckets=metrics.TOKEN_BUCKETS)
+HISTORY_TURNS = metrics.histogram(
+    "session_history_turns", "Turns in a session so far, observed after each turn",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200))
+metrics.gauge("sessions_in_memory", "Sessions held in this process", callback=lambda: len(_sessions))
+metrics.counter("session_evictions_total", "Sessions evicted for the LRU cap or TTL",
+                callback=lambda: _sessions.evictions)
+metrics.counter("session_spill_loads_total", "Evicted sessions restored from the spill file",
+                callback=lambda: _sessions.spill_loads)
+metrics.counter("session_shared_loads_total", "Sessions reloaded after another worker changed them",
+                callback=lambda: _sessions.shared_loads)
+metrics.counter("session_save_conflicts_total", "Session saves retried because another worker saved first",
+                callback=lambda: _sessions.conflicts)
 
 # Global cached instances
 _llm_instance = None
-_system_prompt = None
+
+# "template": answer field context / field updates for schema fields from the
+# schema itself; "llm": always ask the model (answers are still cached)
+FIELD_HELP_MODE = os.getenv("FIELD_HELP_MODE", "template")
+
+# Field-context answers; FIELD_CACHE_PATH selects a SQLite file shared by
+# workers (and filled by `python field_cache.py warm`), else an in-process LRU.
+_field_cache = FieldContextCache(
+    SQLiteCacheBackend(os.environ["FIELD_CACHE_PATH"]) if os.getenv("FIELD_CACHE_PATH")
+    else LRUCacheBackend(int(os.getenv("FIELD_CACHE_MAX_ENTRIES", "1024")))
+)
+
+# How the schema is put into the system prompt (see prompt_builder.PROMPT_MODES)
+# and whether to mark the static prefix for Bedrock prompt caching
+PROMPT_MODE = os.getenv("PROMPT_MODE", "selective")
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "").lower() in ("1", "true", "yes")
+
+# Prompt content, reloaded when a file changes (checked every
+# CONTENT_WATCH_SECONDS while the server runs; 0 disables) without a restart
+CONTENT_FILES = {
+    "system_prompt": "SYSTEM_PROMPT.md",
+    "knowledge_base": "KNOWLEDGEBASE.md",
+    "schema": "questions_schema.json",
+}
+CONTENT_WATCH_SECONDS = float(os.getenv("CONTENT_WATCH_SECONDS", "2"))
+
+# Knowledge base and field chunks added to free-form questions, from a BM25
+# index kept in RETRIEVAL_INDEX_PATH (rebuilt when the content changes; empty
+# keeps it in memory only)
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+RETRIEVAL_INDEX_PATH = os.getenv("RETRIEVAL_INDEX_PATH", "retrieval_index.npz")
+
+# Added to the next prompt of a conversation that started on older content
+CONTENT_CHANGED_NOTE = ("Note: the form schema or service documentation was updated after earlier turns of this "
+                        "conversation; where they differ, follow the current version above.")
+
+
+def build_content(texts):
+    """Prompt builder, schema index and retrieval index for one version of the content files."""
+    # Leaf field path -> schema metadata
+    schema_index = SchemaIndex.from_json(texts["schema"])
+    retriever = load_or_build(texts["knowledge_base"], texts["schema"], schema_index, RETRIEVAL_INDEX_PATH or None)
+    return {
+        "prompt_builder": PromptBuilder(texts["system_prompt"], texts["schema"], texts["knowledge_base"],
+                                        mode=PROMPT_MODE, prompt_cache=PROMPT_CACHE, retriever=retriever,
+                                        top_k=RETRIEVAL_TOP_K),
+        "schema_index": schema_index,
+        "retriever": retriever,
+    }
+
+
+def _content_loaded(snapshot):
+    # Field context depends only on the schema, prompt template and knowledge
+    # base; drop cached answers if any of them changed since the last load
+    texts = snapshot.texts
+    _field_cache.set_content(texts["schema"], texts["system_prompt"] + texts["knowledge_base"] + PROMPT_MODE)
+
+
+_content = ContentLoader(CONTENT_FILES, build_content, poll_interval=CONTENT_WATCH_SECONDS)
+_content.listeners.append(_content_loaded)
+metrics.counter("content_reloads_total", "Prompt content reloads after a file changed",
+                callback=lambda: _content.reloads)
+metrics.counter("content_reload_failures_total", "Content reloads rejected (old content kept)",
+                callback=lambda: _content.failures)
+metrics.gauge("content_loaded_timestamp_seconds", "When the current prompt content was loaded",
+              callback=lambda: _content.current.loaded_at)
+
+# "bedrock" (default) or "fake" for the local stand-in in fake_llm.py, configured
+# by FAKE_LLM_LATENCY / FAKE_LLM_TOKENS_PER_SECOND / FAKE_LLM_FAILURE_RATE
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "bedrock")
+LLM_MODEL_ID = os.getenv("LLM_MODEL_ID", "anthropic.claude-3-sonnet-20240229-v1:0")
+# Optional cheaper/faster model for short confirmations and summaries, also
+# used while the primary model's circuit breaker is open
+LLM_FAST_MODEL_ID = os.getenv("LLM_FAST_MODEL_ID", "")
+
+# Bounds for async LLM calls (shared across all sessions in this process)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+
+# Concurrency limit, retries, rate limits (0: no limit; set to the account's
+# Bedrock quota), coalescing and circuit breaking for all LLM calls
+_gateway = LLMGateway(
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+    backoff_base=float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5")),
+    backoff_max=float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8")),
+    requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")),
+    tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", "0")),
+    breaker_failures=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+    breaker_reset_seconds=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+)
+# Strong references to fire-and-forget tasks so they are not garbage collected
+_background_tasks = set()
+
+
+def get_session(session_id="default"):
+    """Get or create the state for a session."""
+    return _sessions.get(session_id)
+
+
+async def get_session_async(session_id="default"):
+    """get_session for async code; a shared backend or spill file is read off the event loop."""
+    return await _sessions.get_async(session_id)
+
+
+def update_session(session_id, change):
+    """Apply `change(session)` and save the session for the other workers; returns it.
+
+    With a shared backend `change` is applied again to a reloaded copy if
+    another worker saved the session in between (see SessionStore.update).
+    """
+    return _sessions.update(session_id, change)
+
+
+async def update_session_async(session_id, change):
+    """update_session for async code."""
+    return await _sessions.update_async(session_id, change)
 
 
 def get_memory(session_id="default"):
     """Get or create memory for a session."""
-    if session_id not in _memories:
-        _memories[session_id] = ConversationBufferMemory(return_messages=True)
-    return _memories[session_id]
+    return get_session(session_id).memory
 
 
-def init_agent():
-    """Initialize/refresh LLM and system prompt."""
-    global _llm_instance, _system_prompt
+def get_field_cache():
+    """Get the field-context cache."""
+    return _field_cache
 
-    print("Initializing agent...")
-    
-    _llm_instance = ChatBedrock(
-        model="anthropic.claude-3-sonnet-20240229-v1:0",
+
+metrics.counter("field_cache_hits_total", "Field-context cache hits", callback=lambda: _field_cache.hits)
+metrics.counter("field_cache_misses_total", "Field-context cache misses", callback=lambda: _field_cache.misses)
+metrics.gauge("field_cache_hit_ratio", "Field-context cache hit rate",
+              callback=lambda: _field_cache.stats()["hit_rate"])
+
+
+@contextmanager
+def llm_call(kind):
+    """Time an LLM call and count it if it fails."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        LLM_ERRORS.inc(kind=kind, error=type(e).__name__)
+        raise
+    finally:
+        LLM_SECONDS.observe(time.perf_counter() - start, kind=kind)
+
+
+def record_usage(kind, response, prompt_tokens):
+    """Count a response's tokens, estimating those the model did not report."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    LLM_INPUT_TOKENS.inc(usage.get("input_tokens") or prompt_tokens, kind=kind)
+    LLM_OUTPUT_TOKENS.inc(usage.get("output_tokens") or estimate_tokens(content_text(response.content)),
+                          kind=kind)
+
+
+def create_llm(model_id=None):
+    """Create the chat model selected by LLM_PROVIDER."""
+    if LLM_PROVIDER == "fake":
+        from fake_llm import FakeChatModel
+        return FakeChatModel.from_env()
+    return ChatBedrock(
+        model=model_id or LLM_MODEL_ID,
         region="us-west-2"
     )
-    with open("SYSTEM_PROMPT.md", "r") as f:
-        system_prompt = f.read().strip()
-    
-    with open("KNOWLEDGEBASE.md", "r") as f:
-        knowledgebase = f.read().strip()
 
-    with open("questions_schema.json", "r") as f:
-        questions_schema = f.read().strip()
-        
-    env = Environment(loader=BaseLoader())
-    template = env.from_string(system_prompt)
-    # Current date and time
-    current_date_time = datetime.now().strftime("%Y-%m-%d %H:%M")
-    _system_prompt = template.render({"questions_schema": questions_schema, "date_time": current_date_time })
+
+def init_agent(llm=None, fast_llm=None):
+    """Initialize/refresh LLM and system prompt.
+
+    `llm` and `fast_llm` replace the models from LLM_PROVIDER / LLM_MODEL_ID /
+    LLM_FAST_MODEL_ID (e.g. FakeChatModels in tests). The prompt is rebuilt
+    with the current settings; content edits alone do not need this, they
+    are reloaded without replacing the models.
+    """
+    global _llm_instance
+
+    logger.info("Initializing agent...")
+    
+    _llm_instance = llm if llm is not None else create_llm()
+    if fast_llm is None and llm is None and LLM_FAST_MODEL_ID:
+        fast_llm = create_llm(LLM_FAST_MODEL_ID)
+    _gateway.set_models(_llm_instance, fast_llm)
+    _content.reload(force=True)
 
 
 def get_llm():
@@ -57,72 +293,496 @@ def get_llm():
     return _llm_instance
 
 
+def get_content():
+    """Get the current content snapshot (version, file texts, prompt builder, schema index)."""
+    return _content.current
+
+
+def reload_content(force=False):
+    """Reload the content files now if they changed; returns True if the content changed."""
+    return _content.reload(force=force)
+
+
+async def start_content_watch():
+    """Reload content files in the background when they change."""
+    await _content.start()
+
+
+async def stop_content_watch():
+    await _content.stop()
+
+
+def get_schema_index():
+    """Get the index of schema fields."""
+    return get_content().built["schema_index"]
+
+
+def get_prompt_builder():
+    """Get the system prompt builder."""
+    return get_content().built["prompt_builder"]
+
+
 def get_system_prompt():
-    """Get the system prompt."""
-    if _system_prompt is None:
+    """Get the static part of the system prompt."""
+    return get_prompt_builder().static_prefix
+
+
+def get_gateway():
+    """Get the gateway that all LLM calls go through."""
+    if _llm_instance is None:
         init_agent()
-    return _system_prompt
+    return _gateway
+
+
+def install_llm_executor(loop=None):
+    """Size the loop's default executor so it can serve LLM_MAX_CONCURRENCY calls.
+
+    ChatBedrock.ainvoke runs the blocking boto3 call in the default executor,
+    which is only min(32, cpu_count + 4) threads; on small instances that
+    would be a tighter limit than the gateway's concurrency limit.
+    """
+    loop = loop or asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY + 4))
+
+
+def build_messages(prompt, session_id="default", schema_query=None, session=None):
+    """Build system prompt + summary + recent turns + new prompt for a session.
+
+    `schema_query` (a field path or the user's question) selects which schema
+    sections are detailed in the system prompt. Async callers pass the
+    `session` they already loaded.
+    """
+    if session is None:
+        session = get_session(session_id)
+    memory = session.memory
+    content = get_content()
+
+    # Bedrock only accepts a leading system message, so the summary goes there
+    notes = []
+    if memory.summary:
+        notes.append("Summary of the earlier conversation (the form values sent with "
+                     f"requests take precedence over it):\n{memory.summary}")
+    # Earlier turns may refer to fields or documentation that have changed
+    # (the session records the new version with the turn, see record_turn)
+    if session.content_version not in (None, content.version) and memory.total_turns:
+        notes.append(CONTENT_CHANGED_NOTE)
+    system_content = content.built["prompt_builder"].system_content(schema_query, extra="\n\n".join(notes))
+
+    messages: list[BaseMessage] = [SystemMessage(content=system_content)]
+    messages.extend(memory.messages)
+    messages.append(HumanMessage(content=prompt))
+    return messages
+
+
+def _turn_change(session, messages, prompt, memory_text, response, answer=None):
+    """Update prompt token stats for a completed turn; returns the change that saves it to the session."""
+    memory = session.memory
+    prompt_tokens = sum(estimate_tokens(content_text(m.content)) for m in messages)
+    # Old behaviour: system prompt + every full prompt/answer so far + this prompt
+    baseline_tokens = (estimate_tokens(get_system_prompt()) + memory.full_history_tokens
+                       + estimate_tokens(prompt))
+    _token_stats["turns"] += 1
+    _token_stats["prompt_tokens"] += prompt_tokens
+    _token_stats["baseline_prompt_tokens"] += baseline_tokens
+    usage = getattr(response, "usage_metadata", None) or {}
+    _token_stats["reported_input_tokens"] += usage.get("input_tokens", 0)
+    record_usage("chat", response, prompt_tokens)
+    PROMPT_TOKENS.observe(prompt_tokens)
+    logger.debug("📏 Prompt tokens: ~%d (full history would be ~%d)", prompt_tokens, baseline_tokens)
+
+    if answer is None:
+        answer = content_text(response.content)
+    content_version = get_content().version
+
+    def change(session):
+        if session.content_version != content_version:
+            # Field names may have changed too, so the form is shown afresh
+            if session.content_version is not None and session.memory.total_turns:
+                session.form.forget_sent()
+            session.content_version = content_version
+        session.memory.save_turn(memory_text or prompt, answer, prompt=prompt)
+        HISTORY_TOKENS.observe(session.memory.history_tokens())
+        HISTORY_TURNS.observe(session.memory.total_turns)
+
+    return change
+
+
+def record_turn(session, messages, prompt, memory_text, response, answer=None):
+    """Save a completed turn to the session's memory and update prompt token stats.
+
+    `answer` replaces the response text in history (see AgentReply.memory_text).
+    Returns the saved session, which may be a reloaded copy with a shared backend.
+    """
+    return update_session(session.session_id, _turn_change(session, messages, prompt, memory_text, response, answer))
+
+
+async def record_turn_async(session, messages, prompt, memory_text, response, answer=None):
+    """record_turn for async code."""
+    change = _turn_change(session, messages, prompt, memory_text, response, answer)
+    return await update_session_async(session.session_id, change)
+
+
+def get_token_stats():
+    """Prompt token totals and per-turn averages, before/after summarization."""
+    stats = dict(_token_stats)
+    turns = stats["turns"] or 1
+    stats["avg_prompt_tokens"] = stats["prompt_tokens"] / turns
+    stats["avg_baseline_prompt_tokens"] = stats["baseline_prompt_tokens"] / turns
+    return stats
+
+
+def _start_fold(memory):
+    """Claim the turns to fold into the summary, or None if nothing to do."""
+    if memory.folding:
+        return None
+    turns = memory.turns_to_fold()
+    if not turns:
+        return None
+    memory.folding = True
+    summary_prompt = memory.summary_prompt(turns)
+    _token_stats["summary_calls"] += 1
+    _token_stats["summary_tokens"] += estimate_tokens(summary_prompt)
+    return turns, [HumanMessage(content=summary_prompt)]
+
+
+def _summary_text(response, messages):
+    record_usage("summary", response, estimate_tokens(messages[0].content))
+    return response.content
+
+
+def _fold_change(turns, summary):
+    def change(session):
+        memory = session.memory
+        # If summarization failed the turns are still dropped to stay in budget
+        if memory.fold(turns, summary if summary is not None else memory.summary):
+            # The folded turns carried form changes the summary may not keep exactly
+            session.form.forget_sent()
+        memory.folding = False
+    return change
+
+
+def _finish_fold(session, turns, summary):
+    session.memory.folding = False
+    update_session(session.session_id, _fold_change(turns, summary))
+
+
+async def _finish_fold_async(session, turns, summary):
+    session.memory.folding = False
+    await update_session_async(session.session_id, _fold_change(turns, summary))
+
+
+def summarize_memory(session, gateway):
+    """Fold turns beyond the memory budget into the rolling summary."""
+    pending = _start_fold(session.memory)
+    if pending is None:
+        return
+    turns, messages = pending
+    summary = None
+    try:
+        with llm_call("summary"):
+            response = gateway.invoke(messages, fast=True)
+        summary = _summary_text(response, messages)
+    except Exception as e:
+        logger.warning("Error summarizing conversation: %r", e)
+    finally:
+        _finish_fold(session, turns, summary)
+
+
+async def summarize_memory_async(session, gateway, timeout=None):
+    """Async variant of summarize_memory, bounded like ask_agent_async."""
+    pending = _start_fold(session.memory)
+    if pending is None:
+        return
+    turns, messages = pending
+    summary = None
+    try:
+        with llm_call("summary"):
+            response = await asyncio.wait_for(
+                gateway.ainvoke(messages, fast=True), timeout=LLM_TIMEOUT_SECONDS if timeout is None else timeout
+            )
+        summary = _summary_text(response, messages)
+    except Exception as e:
+        logger.warning("Error summarizing conversation: %r", e)
+    finally:
+        await _finish_fold_async(session, turns, summary)
+
+
+def schedule_summary(session, gateway, timeout=None):
+    """Fold old turns into the summary in a background task, if needed."""
+    memory = session.memory
+    if memory.folding or not memory.turns_to_fold():
+        return
+    task = asyncio.create_task(summarize_memory_async(session, gateway, timeout))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
 
 def debug_memory_state(session_id="default"):
-    """Debug function to inspect memory state."""
+    """Debug function to inspect memory state (logged at DEBUG level)."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return None
     try:
         memory = get_memory(session_id)
-        messages = memory.chat_memory.messages
-        print(f"\n=== DEBUG: Memory State for Session '{session_id}' ===")
-        print(f"Message History ({len(messages)} messages):")
+        messages = memory.messages
+        lines = [f"=== DEBUG: Memory State for Session '{session_id}' ===",
+                 f"Summary: {memory.summary or '(none)'}",
+                 f"History tokens: ~{memory.history_tokens()} / {memory.max_tokens}",
+                 f"Message History ({len(messages)} messages):"]
         for i, msg in enumerate(messages):
             msg_type = type(msg).__name__
             content_preview = msg.content[:50] + "..." if len(msg.content) > 50 else msg.content
-            print(f"  {i+1}. {msg_type}: {content_preview}")
-        print("=" * 50)
+            lines.append(f"  {i+1}. {msg_type}: {content_preview}")
+        logger.debug("\n".join(lines))
         return messages
     except Exception as e:
-        print(f"Error debugging memory state: {e}")
+        logger.warning("Error debugging memory state: %r", e)
         return None
 
 
-def ask_agent(prompt, session_id="default", debug=False, role="user"):
-    """Send a prompt to the agent and return the response."""
+def ask_agent(prompt, session_id="default", debug=False, role="user", memory_text=None, schema_query=None):
+    """Send a prompt to the agent and return the response.
+
+    `memory_text` is what gets stored in the conversation history instead of
+    the full prompt, so per-request context like form state is not replayed.
+    `schema_query` picks the schema sections to detail (see build_messages).
+    """
     try:
-        memory = get_memory(session_id)
-        llm = get_llm()
-        if llm is None:
-            raise RuntimeError("Failed to initialize LLM")
-        system_prompt = get_system_prompt()
+        session = get_session(session_id)
+        gateway = get_gateway()
         
-        print(f"\n🔍 Asking agent in session '{session_id}': {prompt}")
+        logger.info("🔍 Asking agent in session '%s'", session_id)
+        logger.debug("Prompt: %s", prompt)
         
         if debug:
-            print(f"\n--- BEFORE: Session '{session_id}' ---")
+            logger.debug("--- BEFORE: Session '%s' ---", session_id)
             debug_memory_state(session_id)
         
-        # Ensure system_prompt is not None
-        if system_prompt is None:
-            system_prompt = "You are a helpful AI assistant."
-        
         # Build messages: system + conversation history + new prompt
-        messages: list[BaseMessage] = [SystemMessage(content=system_prompt)]
-        messages.extend(memory.chat_memory.messages)
-        messages.append(HumanMessage(content=prompt))
+        messages = build_messages(prompt, session_id, schema_query, session)
         
-        response = llm.invoke(messages)
+        with llm_call("chat"):
+            response = gateway.invoke(messages)
         
-        # Save to memory
-        memory.save_context({"input": prompt}, {"output": response.content})
+        # Save to memory and fold old turns into the summary if over budget
+        session = record_turn(session, messages, prompt, memory_text, response)
+        summarize_memory(session, gateway)
         
         if debug:
-            print(f"\n--- AFTER: Session '{session_id}' ---")
+            logger.debug("--- AFTER: Session '%s' ---", session_id)
             debug_memory_state(session_id)
         
-        # print(f"\nReceived answer: {response.content}")
+        logger.debug("Received answer: %s", response.content)
+        return response.content
+    except Exception as e:
+        logger.error("An error occurred: %r", e)
+        return None
+
+
+async def ask_agent_async(prompt, session_id="default", debug=False, role="user", timeout=None,
+                          memory_text=None, schema_query=None, fast=False):
+    """Async variant of ask_agent that does not block the event loop.
+
+    Calls are bounded by LLM_MAX_CONCURRENCY (in the gateway; ChatBedrock
+    runs boto3 calls in the default executor) and each one is cancelled after
+    `timeout` seconds (LLM_TIMEOUT_SECONDS by default), retries included.
+    Returns None on error or timeout, like ask_agent. Summarizing old turns
+    happens in the background so it does not delay the answer. `fast` marks
+    short confirmation prompts that the fast model can answer.
+    """
+    timeout = LLM_TIMEOUT_SECONDS if timeout is None else timeout
+    try:
+        session = await get_session_async(session_id)
+        gateway = get_gateway()
+
+        logger.info("🔍 Asking agent (async) in session '%s'", session_id)
+        logger.debug("Prompt: %s", prompt)
+
+        if debug:
+            logger.debug("--- BEFORE: Session '%s' ---", session_id)
+            debug_memory_state(session_id)
+
+        messages = build_messages(prompt, session_id, schema_query, session)
+
+        with llm_call("chat"):
+            response = await asyncio.wait_for(gateway.ainvoke(messages, fast=fast), timeout=timeout)
+
+        session = await record_turn_async(session, messages, prompt, memory_text, response)
+        schedule_summary(session, gateway, timeout)
+
+        if debug:
+            logger.debug("--- AFTER: Session '%s' ---", session_id)
+            debug_memory_state(session_id)
+
         return response.content
+    except asyncio.TimeoutError:
+        logger.error("LLM call timed out after %ss in session '%s'", timeout, session_id)
+        return None
+    except Exception as e:
+        logger.error("An error occurred: %r", e)
+        return None
+
+
+async def ask_agent_reply_async(prompt, session_id="default", timeout=None, memory_text=None, schema_query=None):
+    """Like ask_agent_async, but the model may also fill in form fields.
+
+    The update_form_field tool is offered to the model and its calls are
+    validated against the schema. Returns an AgentReply, or None on error or
+    timeout.
+    """
+    timeout = LLM_TIMEOUT_SECONDS if timeout is None else timeout
+    try:
+        session = await get_session_async(session_id)
+        gateway = get_gateway()
+
+        logger.info("🔍 Asking agent (async, form updates) in session '%s'", session_id)
+        logger.debug("Prompt: %s", prompt)
+        messages = build_messages(prompt, session_id, schema_query, session)
+        with llm_call("chat"):
+            response = await asyncio.wait_for(gateway.ainvoke(messages, tools=[FORM_UPDATE_TOOL]), timeout=timeout)
+
+        reply = parse_reply(response, get_schema_index())
+        session = await record_turn_async(session, messages, prompt, memory_text, response,
+                                          answer=reply.memory_text())
+        schedule_summary(session, gateway, timeout)
+        return reply
+    except asyncio.TimeoutError:
+        logger.error("LLM call timed out after %ss in session '%s'", timeout, session_id)
+        return None
+    except Exception as e:
+        logger.error("An error occurred: %r", e)
+        return None
+
+
+async def stream_agent(prompt, session_id="default", timeout=None, memory_text=None, schema_query=None,
+                       reply=None):
+    """Stream the agent's answer as text chunks (async generator).
+
+    Bounded by the same concurrency limit as ask_agent_async; `timeout` applies to
+    the wait for each chunk, including the first. The complete turn is saved
+    to memory once the stream ends. Errors are raised to the caller.
+
+    Passing an AgentReply as `reply` offers the form-update tool to the model
+    and fills in `reply` (answer and validated updates) when the stream ends.
+    """
+    timeout = LLM_TIMEOUT_SECONDS if timeout is None else timeout
+    session = await get_session_async(session_id)
+    gateway = get_gateway()
+    tools = [FORM_UPDATE_TOOL] if reply is not None else None
+
+    logger.info("🔍 Streaming agent answer in session '%s'", session_id)
+    logger.debug("Prompt: %s", prompt)
+    messages = build_messages(prompt, session_id, schema_query, session)
+
+    response = None
+    with llm_call("stream"):
+        stream = gateway.astream(messages, tools=tools).__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), timeout=timeout)
+            except StopAsyncIteration:
+                break
+            # Adding chunks merges content and usage metadata
+            response = chunk if response is None else response + chunk
+            # Tool-call chunks carry no text
+            text = content_text(chunk.content)
+            if text:
+                yield text
+
+    if response is not None:
+        answer = None
+        if reply is not None:
+            answer = parse_reply(response, get_schema_index(), reply).memory_text()
+        session = await record_turn_async(session, messages, prompt, memory_text, response, answer=answer)
+        schedule_summary(session, gateway, timeout)
+
+
+async def complete_async(prompt, timeout=None, schema_query=None):
+    """One-off prompt with the system prompt but no session history."""
+    timeout = LLM_TIMEOUT_SECONDS if timeout is None else timeout
+    gateway = get_gateway()
+    system_content = get_prompt_builder().system_content(schema_query)
+    messages = [SystemMessage(content=system_content), HumanMessage(content=prompt)]
+    with llm_call("completion"):
+        # Concurrent requests for the same field share one call
+        response = await asyncio.wait_for(gateway.ainvoke(messages), timeout=timeout)
+    record_usage("completion", response, sum(estimate_tokens(content_text(m.content)) for m in messages))
+    return response.content
+
+
+def remember_turn(session_id, memory_text, answer):
+    """Add a turn answered outside ask_agent to the session history."""
+    update_session(session_id, lambda session: session.memory.save_turn(memory_text, answer))
+
+
+async def remember_turn_async(session_id, memory_text, answer):
+    """remember_turn for async code."""
+    await update_session_async(session_id, lambda session: session.memory.save_turn(memory_text, answer))
+
+
+def get_field_updated_message(field_name, value):
+    """Confirmation for a field update, or None if the LLM should write it."""
+    field = get_schema_index().get(field_name)
+    if FIELD_HELP_MODE != "template" or field is None:
+        return None
+    return render_field_updated(field, value)
+
+
+async def get_field_context_async(field_name, field_label):
+    """Explain a form field. Returns None on error.
+
+    Schema fields are rendered from their metadata without an LLM call (in
+    "template" mode); anything else goes to the LLM through the cache.
+    """
+    field = get_schema_index().get(field_name)
+    if field is not None:
+        if FIELD_HELP_MODE == "template":
+            return render_field_context(field)
+        # Prefer the schema title so the answer depends on the field path only
+        field_label = field.title
+    return await _llm_field_context(field_name, field_label)
+
+
+async def _llm_field_context(field_name, field_label):
+    """Ask the LLM to explain a field, through the field-context cache."""
+    get_content()  # make sure the content (and cache version) is loaded
+    answer = _field_cache.get(field_name, field_label)
+    if answer is not None:
+        return answer
+    try:
+        answer = await complete_async(FIELD_CONTEXT_PROMPT.format(field_name=field_name, field_label=field_label),
+                                      schema_query=field_name)
     except Exception as e:
-        print(f"An error occurred: {e}")
+        logger.error("Error getting field context for '%s': %r", field_name, e)
         return None
+    _field_cache.set(field_name, field_label, answer)
+    return answer
+
+
+async def warm_field_cache(concurrency=4):
+    """Precompute LLM field context for every schema leaf missing from the cache.
+
+    Only FIELD_HELP_MODE=llm reads the cache for schema leaves; otherwise they
+    are answered from templates and nothing is warmed.
+    """
+    if FIELD_HELP_MODE != "llm":
+        logger.info("FIELD_HELP_MODE=%s renders schema field help from templates; not warming the field cache",
+                    FIELD_HELP_MODE)
+        return 0
+    limit = asyncio.Semaphore(concurrency)
+
+    async def warm(field_name, field_label):
+        if _field_cache.backend.get(_field_cache.key(field_name, field_label)) is not None:
+            return 0
+        async with limit:
+            return 1 if await _llm_field_context(field_name, field_label) is not None else 0
+
+    results = await asyncio.gather(*(warm(path, title) for path, title in get_schema_index().leaves()))
+    return sum(results)
 
 
 def main():
+    # DEBUG so the memory inspection below is shown
+    setup_logging("DEBUG")
     # Test with multiple sessions to see memory isolation
     print("=== Testing Session Memory ===")
     
@@ -57,6 +57,8 @@ export class OnboardingComponent implements OnInit, OnDestroy, AfterViewChecked
   chatMessages: ChatMessage[] = [];
   newMessage = '';
   isLoading = false;
+  // Assistant message currently being filled by a streamed answer
+  streamingMessage?: ChatMessage;
   isFieldContextLoading = false; // Add a lock for field context requests
   messageCounter = 0;
   chatExpanded = true;
@@ -399,15 +401,35 @@ export class OnboardingComponent implements OnInit, OnDestroy, AfterViewChecked
     // Get current form state
     const currentFormData = this.getCompleteFormData();
 
-    this.chatService.askAgent(this.newMessage, currentFormData).subscribe({
-      next: (response) => {
-        this.addMessage(response.answer, false);
-        this.isLoading = false;
-      },
+    // Show the answer as it streams in over the WebSocket, if available
+    const requestId = this.chatService.canStream() ? `${Date.now()}-${this.messageCounter}` : undefined;
+    const streamSubscription = requestId ? this.chatService.getChatStream().subscribe(event => {
+      if (event.requestId !== requestId || event.type !== 'chat-chunk') return;
+      if (!this.streamingMessage) {
+        this.addMessage('', false);
+        this.streamingMessage = this.chatMessages[this.chatMessages.length - 1];
+      }
+      this.streamingMessage.text += event.payload;
+      this.shouldScrollToBottom = true;
+    }) : undefined;
+
+    const finish = (text: string) => {
+      streamSubscription?.unsubscribe();
+      // The complete answer replaces whatever was streamed
+      if (this.streamingMessage) {
+        this.streamingMessage.text = text;
+      } else {
+        this.addMessage(text, false);
+      }
+      this.streamingMessage = undefined;
+      this.isLoading = false;
+    };
+
+    this.chatService.askAgent(this.newMessage, currentFormData, requestId).subscribe({
+      next: (response) => finish(response.answer),
       error: (error) => {
         console.error('Error sending message:', error);
-        this.addMessage('Error sending message. Please check if the backend is running.', false);
-        this.isLoading = false;
+        finish('Error sending message. Please check if the backend is running.');
       }
     });
 
@@ -421,8 +443,7 @@ export class OnboardingComponent implements OnInit, OnDestroy, AfterViewChecked
     if (fieldPath === 'formTitle') return;
     this.isFieldContextLoading = true;
     const fieldData: FormField = { name: fieldPath, value: fieldLabel };
-    const completeFormData = this.getCompleteFormData();
-    this.chatService.getFieldContext(fieldData, completeFormData).subscribe({
+    this.chatService.getFieldContext(fieldData).subscribe({
       next: (response) => {
         this.addMessage(response.answer, false);
         this.isFieldContextLoading = false;
@@ -1,6 +1,6 @@
 import { Injectable } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
-import { Observable, Subject } from 'rxjs';
+import { Observable, Subject, catchError, of, switchMap, tap, throwError } from 'rxjs';
 
 export interface ChatMessage {
   id: number;
@@ -14,6 +14,13 @@ export interface FormField {
   value: any;
 }
 
+// Streamed answer events from /ws, tagged with the requestId passed to askAgent
+export interface ChatStreamEvent {
+  type: 'chat-chunk' | 'chat-done' | 'chat-error';
+  requestId: string;
+  payload: any;
+}
+
 @Injectable({
   providedIn: 'root'
 })
@@ -21,6 +28,13 @@ export class ChatService {
   private apiUrl = 'http://localhost:8000/api';
   private ws?: WebSocket;
   private formUpdatesSubject = new Subject<any>();
+  private chatStreamSubject = new Subject<ChatStreamEvent>();
+  // Issued by /api/start-agent; identifies this browser's conversation
+  private sessionId = sessionStorage.getItem('agentSessionId') || '';
+  // The backend keeps the session's form; this is its version and the values
+  // (by dotted field path) it is known to hold, so only changes are sent
+  private formVersion = 0;
+  private syncedForm: { [path: string]: any } = {};
   
   constructor(private http: HttpClient) {
     this.initializeWebSocket();
@@ -30,15 +44,27 @@ export class ChatService {
     const isDev = window.location.port === '7151';
     const wsUrl = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
     const wsPath = isDev ? `${wsUrl}//${window.location.host}/ws` : `${wsUrl}//ec2-44-221-201-229.compute-1.amazonaws.com:7104/proxy/8000/ws`;
+    // Joining the session lets the backend stream answers to this socket
+    const sessionQuery = this.sessionId ? `?sessionId=${encodeURIComponent(this.sessionId)}` : '';
     
-    this.ws = new WebSocket(wsPath);
+    this.ws = new WebSocket(wsPath + sessionQuery);
     
     
     this.ws.onmessage = (event) => {
       try {
       const data = JSON.parse(event.data);
       if (data.type === 'update-form') {
+        this.recordServerUpdates([data.payload], data.payload?.formVersion);
         this.formUpdatesSubject.next(data.payload);
+        } else if (data.type === 'ping') {
+          // Heartbeat: the backend closes sockets that stop answering
+          this.ws?.send(JSON.stringify({ type: 'pong' }));
+        } else if (data.type === 'chat-chunk' || data.type === 'chat-done' || data.type === 'chat-error') {
+          if (data.type === 'chat-done') {
+            this.recordServerUpdates(data.payload?.formUpdates || [], data.payload?.formVersion);
+            (data.payload?.formUpdates || []).forEach((update: any) => this.formUpdatesSubject.next(update));
+          }
+          this.chatStreamSubject.next(data);
         }
       } catch (error) {
         console.error('Error parsing WebSocket message:', error);
@@ -54,33 +80,129 @@ export class ChatService {
     };
   }
 
-  askAgent(prompt: string, formData?: any): Observable<any> {
+  private reconnectWebSocket() {
+    if (this.ws) {
+      this.ws.onclose = null;
+      this.ws.close();
+    }
+    this.initializeWebSocket();
+  }
+
+  // Stream answers over the WebSocket when it is open; the HTTP response still
+  // carries the complete answer
+  canStream(): boolean {
+    return !!this.sessionId && this.ws?.readyState === WebSocket.OPEN;
+  }
+
+  // Nested form values -> { 'section.field': value }; only plain objects are
+  // groups, so arrays and dates (from the datepicker) are single values
+  private flatten(formData: any, prefix = ''): { [path: string]: any } {
+    const flat: { [path: string]: any } = {};
+    Object.entries(formData || {}).forEach(([name, value]) => {
+      const path = prefix ? `${prefix}.${name}` : name;
+      if (value instanceof Date) {
+        flat[path] = this.formatDate(value);
+      } else if (value && Object.getPrototypeOf(value) === Object.prototype) {
+        Object.assign(flat, this.flatten(value, path));
+      } else {
+        flat[path] = value;
+      }
+    });
+    return flat;
+  }
+
+  // The schema's date format (YYYY-MM-DD), in local time like the datepicker
+  private formatDate(date: Date): string {
+    const pad = (n: number) => String(n).padStart(2, '0');
+    return `${date.getFullYear()}-${pad(date.getMonth() + 1)}-${pad(date.getDate())}`;
+  }
+
+  // Field updates made by the agent are already in the backend's form
+  private recordServerUpdates(updates: FormField[], formVersion?: number) {
+    updates.forEach(update => this.syncedForm[update.name] = update.value);
+    if (formVersion) {
+      this.formVersion = formVersion;
+    }
+  }
+
+  // Send the fields changed since the last sync; if the backend's form moved
+  // on in between (409), send the whole form instead
+  syncForm(formData?: any): Observable<any> {
+    if (!formData || !this.sessionId) {
+      return of(null);
+    }
+    const current = this.flatten(formData);
+    const patch: { [path: string]: any } = {};
+    Object.entries(current).forEach(([path, value]) => {
+      if (JSON.stringify(value) !== JSON.stringify(this.syncedForm[path])) {
+        patch[path] = value;
+      }
+    });
+    Object.keys(this.syncedForm).filter(path => !(path in current)).forEach(path => patch[path] = null);
+    if (!Object.keys(patch).length) {
+      return of(null);
+    }
+    const send = (body: any) => this.http.post(`${this.apiUrl}/update-form-field`, { ...body, sessionId: this.sessionId }).pipe(
+      tap((response: any) => {
+        this.formVersion = response.formVersion;
+        this.syncedForm = current;
+      })
+    );
+    return send({ patch, baseVersion: this.formVersion }).pipe(
+      catchError(error => error?.status === 409 ? send({ patch: current, replace: true }) : throwError(() => error))
+    );
+  }
+
+  askAgent(prompt: string, formData?: any, requestId?: string): Observable<any> {
     const encodedPrompt = encodeURIComponent(prompt);
-    const url = formData ? 
-      `${this.apiUrl}/ask-agent/${encodedPrompt}?formData=${encodeURIComponent(JSON.stringify(formData))}` :
-      `${this.apiUrl}/ask-agent/${encodedPrompt}`;
-    return this.http.get(url);
+    let sessionParam = `sessionId=${encodeURIComponent(this.sessionId)}`;
+    if (requestId) {
+      sessionParam += `&requestId=${encodeURIComponent(requestId)}`;
+    }
+    // The form goes to the backend as a patch, never in the query string
+    return this.syncForm(formData).pipe(
+      switchMap(() => this.http.get(`${this.apiUrl}/ask-agent/${encodedPrompt}?${sessionParam}`)),
+      tap((response: any) => this.recordServerUpdates([], response?.formVersion))
+    );
   }
 
   startAgent(formData?: any): Observable<any> {
-    const url = formData ? 
-      `${this.apiUrl}/start-agent?formData=${encodeURIComponent(JSON.stringify(formData))}` :
-      `${this.apiUrl}/start-agent`;
-    return this.http.get(url);
+    const payload: any = { sessionId: this.sessionId || undefined };
+    if (formData) {
+      payload.formData = this.flatten(formData);
+    }
+    return this.http.post(`${this.apiUrl}/start-agent`, payload).pipe(
+      tap((response: any) => {
+        if (response?.sessionId && response.sessionId !== this.sessionId) {
+          this.sessionId = response.sessionId;
+          sessionStorage.setItem('agentSessionId', this.sessionId);
+          this.reconnectWebSocket();
+        }
+        // The backend's form now matches what was sent
+        this.formVersion = response?.formVersion || 0;
+        this.syncedForm = formData ? this.flatten(formData) : {};
+      })
+    );
   }
 
   updateFormField(fieldData: FormField, completeFormData?: any): Observable<any> {
-    const payload = { ...fieldData, completeFormData: completeFormData || {} };
-    return this.http.post(`${this.apiUrl}/update-form-field`, payload);
+    // Other changed fields are synced first; the backend only needs this one to answer
+    return this.syncForm(completeFormData).pipe(
+      switchMap(() => this.http.post(`${this.apiUrl}/update-form-field`, { ...fieldData, sessionId: this.sessionId })),
+      tap((response: any) => {
+        this.syncedForm[fieldData.name] = fieldData.value;
+        this.recordServerUpdates([], response?.formVersion);
+      })
+    );
   }
 
-  toggleSmartGuide(enabled: boolean, formData?: any): Observable<any> {
-    const payload = { enabled, formData: formData || {} };
+  toggleSmartGuide(enabled: boolean): Observable<any> {
+    const payload = { enabled, sessionId: this.sessionId };
     return this.http.post(`${this.apiUrl}/toggle-smart-guide`, payload);
   }
 
-  getFieldContext(fieldData: FormField, completeFormData?: any): Observable<any> {
-    const payload = { ...fieldData, completeFormData: completeFormData || {} };
+  getFieldContext(fieldData: FormField): Observable<any> {
+    const payload = { ...fieldData, sessionId: this.sessionId };
     return this.http.post(`${this.apiUrl}/get-field-context`, payload);
   }
 
@@ -88,6 +210,10 @@ export class ChatService {
     return this.formUpdatesSubject.asObservable();
   }
 
+  getChatStream(): Observable<ChatStreamEvent> {
+    return this.chatStreamSubject.asObservable();
+  }
+
   submitForm(formData: any): Observable<any> {
     return this.http.post(`${this.apiUrl}/submit-form`, formData);
   }
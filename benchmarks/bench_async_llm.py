@@ -0,0 +1,105 @@
+"""Load benchmark for the async LLM path using a stubbed Bedrock model.
+
+Runs the FastAPI app in-process (httpx ASGI transport) against a stub LLM with
+a fixed latency and reports request throughput per number of concurrent
+clients. `--mode blocking` swaps the endpoints back to the synchronous
+`ask_agent` call to show how one slow LLM call stalls the event loop.
+
+Usage:
+    python benchmarks/bench_async_llm.py --latency 0.5 --clients 1 2 4 8 16
+    python benchmarks/bench_async_llm.py --mode blocking
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+class StubLLM:
+    """Stand-in for ChatBedrock: blocking invoke with a fixed latency.
+
+    Like ChatBedrock, it has no native async client, so ainvoke runs invoke
+    in the default executor.
+    """
+
+    def __init__(self, latency, answer="Stub answer."):
+        self.latency = latency
+        self.answer = answer
+
+    def invoke(self, messages):
+        from langchain_core.messages import AIMessage
+        time.sleep(self.latency)
+        return AIMessage(content=self.answer)
+
+    async def ainvoke(self, messages):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.invoke, messages)
+
+
+async def run_level(client, clients, requests_per_client):
+    """Run `clients` concurrent clients and return (elapsed, completed)."""
+    async def one_client(idx):
+        done = 0
+        for i in range(requests_per_client):
+            # Distinct prompts, so the gateway does not coalesce the clients' calls
+            resp = await client.get(f"/api/ask-agent/hello-{idx}-{i}", params={"sessionId": f"bench-{idx}"})
+            if resp.status_code == 200:
+                done += 1
+        return done
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one_client(i) for i in range(clients)))
+    return time.perf_counter() - start, sum(results)
+
+
+async def main_async(args):
+    import httpx
+    import agent
+    import main
+
+    # The ASGI transport does not run lifespan events, so do main's startup here
+    agent.install_llm_executor()
+    agent.init_agent(llm=StubLLM(args.latency))
+
+    if args.mode == "blocking":
+        async def blocking_ask(prompt, session_id="default", **kwargs):
+            return agent.ask_agent(prompt, session_id=session_id, **kwargs)
+        main.ask_agent_async = blocking_ask
+
+        async def blocking_reply(prompt, session_id="default", **kwargs):
+            from form_updates import AgentReply
+            answer = agent.ask_agent(prompt, session_id=session_id, **kwargs)
+            return None if answer is None else AgentReply(answer)
+        main.ask_agent_reply_async = blocking_reply
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"mode={args.mode} latency={args.latency}s "
+              f"max_concurrency={agent.LLM_MAX_CONCURRENCY} requests/client={args.requests}")
+        print(f"{'clients':>8} {'requests':>9} {'seconds':>8} {'req/s':>8}")
+        for clients in args.clients:
+            elapsed, done = await run_level(client, clients, args.requests)
+            print(f"{clients:>8} {done:>9} {elapsed:>8.2f} {done / elapsed:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["async", "blocking"], default="async")
+    parser.add_argument("--latency", type=float, default=0.5, help="stub LLM latency in seconds")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=4, help="requests per client")
+    parser.add_argument("--max-concurrency", type=int, default=None,
+                        help="override LLM_MAX_CONCURRENCY")
+    args = parser.parse_args()
+    if args.max_concurrency is not None:
+        os.environ["LLM_MAX_CONCURRENCY"] = str(args.max_concurrency)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
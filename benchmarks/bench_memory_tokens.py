@@ -0,0 +1,71 @@
+"""Prompt tokens per turn for a scripted Smart Guide session.
+
+Replays field focus / field update / question turns against the FastAPI app
+with a stubbed LLM and prints the estimated prompt tokens of every turn next
+to what the old unbounded ConversationBufferMemory would have sent.
+
+Usage:
+    python benchmarks/bench_memory_tokens.py --turns 40
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from bench_async_llm import StubLLM  # noqa: E402
+
+
+async def main_async(args):
+    import httpx
+    import agent
+    import main
+
+    agent.install_llm_executor()
+    # The real, full system prompt, so only the history differs from the baseline
+    agent.PROMPT_MODE = "full"
+    agent.init_agent(llm=StubLLM(0, answer="Perfect! That field is set. " * 3))
+    agent.FIELD_HELP_MODE = "llm"  # every turn goes to the model, as before schema templates
+
+    fields = list(agent.get_schema_index().leaves())
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        resp = await client.get("/api/start-agent")
+        session_id = resp.json()["sessionId"]
+        print(f"{'turn':>4} {'kind':<8} {'prompt':>7} {'baseline':>9}")
+        for turn in range(args.turns):
+            before = agent.get_token_stats()
+            path, title = fields[(turn // 2) % len(fields)]
+            if turn % 2 == 0:
+                await client.post("/api/get-field-context",
+                                  json={"name": path, "value": title, "sessionId": session_id})
+                kind = "focus"
+            else:
+                await client.post("/api/update-form-field", json={
+                    "name": path, "value": f"value {turn}", "sessionId": session_id})
+                kind = "update"
+            # Let background summarization finish before measuring the next turn
+            await asyncio.sleep(0)
+            after = agent.get_token_stats()
+            print(f"{turn + 1:>4} {kind:<8} "
+                  f"{after['prompt_tokens'] - before['prompt_tokens']:>7} "
+                  f"{after['baseline_prompt_tokens'] - before['baseline_prompt_tokens']:>9}")
+
+    stats = agent.get_token_stats()
+    print(f"\navg prompt tokens/turn: {stats['avg_prompt_tokens']:.0f} "
+          f"(baseline {stats['avg_baseline_prompt_tokens']:.0f}); "
+          f"summary calls: {stats['summary_calls']} (~{stats['summary_tokens']} tokens)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=40)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Input tokens and latency per endpoint for each prompt builder mode.
+
+Replays the same requests against every endpoint that calls the LLM with
+PROMPT_MODE=full (the old behaviour), compact and selective. The stub LLM's
+latency grows with input size (`--prefill-ms-per-1k` per 1000 input tokens)
+to approximate Bedrock prefill time. Field help is forced through the LLM
+(FIELD_HELP_MODE=llm) so those endpoints are measured too.
+
+Usage:
+    python benchmarks/bench_prompt_builder.py --prefill-ms-per-1k 80
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from bench_async_llm import StubLLM  # noqa: E402
+
+QUESTIONS = [
+    "What AWS account number format do you need?",
+    "Which region should I pick as primary?",
+    "What is IODS and do I need it?",
+    "Who should be the technical contact for the target?",
+]
+
+
+class PrefillStubLLM(StubLLM):
+    """Stub whose latency is a base cost plus a per-input-token cost."""
+
+    def __init__(self, base_latency, per_1k_tokens):
+        super().__init__(base_latency, answer="Sure, here is what you need.")
+        self.per_1k_tokens = per_1k_tokens
+        self.calls = []
+
+    def invoke(self, messages):
+        from conversation_memory import estimate_tokens
+        from prompt_builder import content_text
+        tokens = sum(estimate_tokens(content_text(m.content)) for m in messages)
+        # Background summarization calls have no system message; leave them out
+        if messages[0].type == "system":
+            self.calls.append(tokens)
+        time.sleep(self.per_1k_tokens * tokens / 1000)
+        return super().invoke(messages)
+
+
+async def run_mode(agent, main, client, mode, args):
+    agent.PROMPT_MODE = mode
+    llm = PrefillStubLLM(args.base_latency, args.prefill_ms_per_1k / 1000)
+    agent.init_agent(llm=llm)
+    agent.get_field_cache().backend.invalidate(None)  # measure misses, not cached answers
+
+    fields = list(agent.get_schema_index().leaves())[:args.requests]
+    resp = await client.get("/api/start-agent")
+    session_id = resp.json()["sessionId"]
+    calls = {
+        "ask-agent": [lambda i: client.get(f"/api/ask-agent/{QUESTIONS[i % len(QUESTIONS)]}",
+                                           params={"sessionId": session_id})],
+        "get-field-context": [lambda i: client.post("/api/get-field-context", json={
+            "name": fields[i][0], "value": fields[i][1], "sessionId": session_id})],
+        "update-form-field": [lambda i: client.post("/api/update-form-field", json={
+            "name": fields[i][0], "value": "example", "sessionId": session_id})],
+    }
+    results = {"start-agent": (llm.calls[-1], None)}
+    for endpoint, (call,) in calls.items():
+        tokens, latencies = [], []
+        for i in range(args.requests):
+            before = len(llm.calls)
+            start = time.perf_counter()
+            await call(i)
+            latencies.append(time.perf_counter() - start)
+            tokens.extend(llm.calls[before:])
+        results[endpoint] = (sum(tokens) / max(len(tokens), 1), sum(latencies) / len(latencies))
+    return results
+
+
+async def main_async(args):
+    import httpx
+    import agent
+    import main
+
+    agent.install_llm_executor()
+    agent.FIELD_HELP_MODE = "llm"
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'mode':<10} {'endpoint':<18} {'input tokens':>12} {'latency ms':>11}")
+        for mode in args.modes:
+            results = await run_mode(agent, main, client, mode, args)
+            for endpoint, (tokens, latency) in results.items():
+                latency_ms = f"{latency * 1000:.0f}" if latency is not None else "-"
+                print(f"{mode:<10} {endpoint:<18} {tokens:>12.0f} {latency_ms:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=["full", "compact", "selective"])
+    parser.add_argument("--requests", type=int, default=8, help="requests per endpoint")
+    parser.add_argument("--base-latency", type=float, default=0.05, help="stub LLM fixed latency (s)")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=80.0,
+                        help="stub LLM latency per 1000 input tokens (ms)")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""Load test: replays scripted onboarding sessions against a server on a fake LLM.
+
+Starts `uvicorn main:app` with LLM_PROVIDER=fake (no AWS access needed), then
+for each session count runs that many concurrent sessions. Each session does
+what the Angular client does: start-agent, open /ws, turn on the smart guide,
+then focus and fill form fields one after another, asking a question every
+few fields (streamed over the socket). Reports p50/p95/p99 latency per step,
+throughput and the server's resident memory per session count.
+
+Usage:
+    python benchmarks/load_test.py --sessions 1 10 50 --fields 8
+    python benchmarks/load_test.py --latency 1.5 --failure-rate 0.05 --json results.json
+    python benchmarks/load_test.py --url http://localhost:8000 --sessions 20   # existing server
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+QUESTIONS = [
+    "What is IODS and do I need it?",
+    "Which AWS region should I pick for the cloud details?",
+    "What is the difference between inbound and outbound transfers?",
+    "Who should I list as the technical contact?",
+    "What format does the S3 bucket ARN need to be in?",
+    "Can I change the environments later?",
+]
+
+
+def sample_value(field):
+    """A plausible value for a schema field."""
+    if field.type == "boolean":
+        return True
+    if field.type == "array":
+        return field.enum[:2]
+    if field.enum:
+        return field.enum[0]
+    if field.format == "date":
+        return "2027-01-15"
+    if field.examples:
+        return field.examples[0]
+    return f"Sample {field.title}"
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def process_rss(pid):
+    """Resident memory in bytes of a process and its children (Linux), or None."""
+    try:
+        total = 0
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                for child in f.read().split():
+                    total += process_rss(int(child)) or 0
+        return total
+    except OSError:
+        return None
+
+
+class Recorder:
+    """Latencies (seconds) and error counts per step name."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def add(self, step, seconds, ok=True):
+        if ok:
+            self.latencies.setdefault(step, []).append(seconds)
+        else:
+            self.errors[step] = self.errors.get(step, 0) + 1
+
+    def requests(self):
+        return sum(len(v) for k, v in self.latencies.items() if k != "ask-agent-first-chunk") + \
+            sum(self.errors.values())
+
+    def summary(self):
+        steps = {}
+        for step in sorted(set(self.latencies) | set(self.errors)):
+            values = self.latencies.get(step, [])
+            steps[step] = {
+                "count": len(values),
+                "errors": self.errors.get(step, 0),
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+                "max_ms": max(values, default=0) * 1000,
+            }
+        return steps
+
+
+class SessionSocket:
+    """The session's /ws connection: answers pings and tracks streamed answers."""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.first_chunk = {}
+        self.done = {}
+        self.reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for raw in self.ws:
+                message = json.loads(raw)
+                if message.get("type") == "ping":
+                    await self.ws.send(json.dumps({"type": "pong"}))
+                request_id = message.get("requestId")
+                if message.get("type") == "chat-chunk" and request_id in self.first_chunk:
+                    self.first_chunk.pop(request_id).set_result(time.perf_counter())
+                elif message.get("type") in ("chat-done", "chat-error") and request_id in self.done:
+                    self.done.pop(request_id).set_result(message["type"])
+        except Exception:
+            pass
+
+    def expect(self, request_id):
+        loop = asyncio.get_running_loop()
+        first, done = loop.create_future(), loop.create_future()
+        self.first_chunk[request_id] = first
+        self.done[request_id] = done
+        return first, done
+
+    async def close(self):
+        self.reader.cancel()
+        await self.ws.close()
+
+
+async def timed(recorder, step, request):
+    """Run one HTTP request, recording its latency; returns the JSON body or None."""
+    start = time.perf_counter()
+    try:
+        response = await request
+        body = response.json() if response.status_code == 200 else None
+    except Exception:
+        body = None
+    ok = body is not None and body.get("answer") is not None
+    recorder.add(step, time.perf_counter() - start, ok)
+    return body
+
+
+async def onboarding_session(client, ws_url, fields, args, recorder, rng):
+    """One user filling the form with the assistant open."""
+    import websockets
+
+    async def think():
+        await asyncio.sleep(rng.uniform(0, args.think))
+
+    body = await timed(recorder, "start-agent", client.get("/api/start-agent"))
+    if body is None:
+        return
+    session_id = body["sessionId"]
+    ws = SessionSocket(await websockets.connect(f"{ws_url}/ws?sessionId={session_id}"))
+    try:
+        await think()
+        await timed(recorder, "smart-guide", client.post(
+            "/api/toggle-smart-guide", json={"sessionId": session_id, "enabled": True}))
+
+        for i, field in enumerate(rng.sample(fields, min(args.fields, len(fields)))):
+            await think()
+            await timed(recorder, "field-context", client.post(
+                "/api/get-field-context", json={"sessionId": session_id, "name": field.path, "value": field.title}))
+            await think()
+            value = sample_value(field)
+            await timed(recorder, "update-field", client.post(
+                "/api/update-form-field",
+                json={"sessionId": session_id, "name": field.path, "value": value}))
+
+            if args.ask_every and (i + 1) % args.ask_every == 0:
+                await think()
+                request_id = uuid.uuid4().hex
+                first, done = ws.expect(request_id)
+                start = time.perf_counter()
+                await timed(recorder, "ask-agent", client.get(
+                    f"/api/ask-agent/{quote(rng.choice(QUESTIONS), safe='')}",
+                    params={"sessionId": session_id, "requestId": request_id}))
+                # Socket messages are queued, so they may trail the HTTP response
+                try:
+                    await asyncio.wait_for(done, timeout=10)
+                except asyncio.TimeoutError:
+                    pass
+                if first.done():
+                    recorder.add("ask-agent-first-chunk", first.result() - start)
+                ws.first_chunk.pop(request_id, None)
+                ws.done.pop(request_id, None)
+    finally:
+        await ws.close()
+
+
+async def run_level(base_url, sessions, fields, args, server_pid):
+    import httpx
+
+    recorder = Recorder()
+    ws_url = "ws" + base_url[len("http"):]
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            onboarding_session(client, ws_url, fields, args, recorder, random.Random(args.seed + i))
+            for i in range(sessions)
+        ))
+        elapsed = time.perf_counter() - start
+    rss = process_rss(server_pid) if server_pid else None
+    return {
+        "sessions": sessions,
+        "elapsed_s": elapsed,
+        "requests": recorder.requests(),
+        "errors": sum(recorder.errors.values()),
+        "throughput_rps": recorder.requests() / elapsed,
+        "server_rss_mb": rss / 2 ** 20 if rss is not None else None,
+        "steps": recorder.summary(),
+    }
+
+
+def print_level(result):
+    rss = f"{result['server_rss_mb']:.1f} MB" if result["server_rss_mb"] is not None else "n/a"
+    print(f"\nsessions={result['sessions']} requests={result['requests']} errors={result['errors']} "
+          f"elapsed={result['elapsed_s']:.2f}s throughput={result['throughput_rps']:.2f} req/s server_rss={rss}")
+    print(f"  {'step':<22} {'count':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for step, s in result["steps"].items():
+        print(f"  {step:<22} {s['count']:>6} {s['errors']:>6} {s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} "
+              f"{s['p99_ms']:>8.1f} {s['max_ms']:>8.1f}")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args):
+    """Run uvicorn on a free port with the fake LLM; returns (process, base URL)."""
+    import httpx
+
+    port = free_port()
+    env = dict(os.environ, LLM_PROVIDER="fake", LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"),
+               FAKE_LLM_LATENCY=str(args.latency), FAKE_LLM_TOKENS_PER_SECOND=str(args.tokens_per_second),
+               FAKE_LLM_FAILURE_RATE=str(args.failure_rate), STATE_BACKEND=args.state_backend)
+    if args.state_backend == "sqlite":
+        env["STATE_SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="load_test_"), "state.db")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/stats").status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit("server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 25])
+    parser.add_argument("--fields", type=int, default=6, help="fields each session fills in")
+    parser.add_argument("--ask-every", type=int, default=3, help="ask a chat question every N fields (0: never)")
+    parser.add_argument("--think", type=float, default=0.2, help="max random pause between steps, seconds")
+    parser.add_argument("--latency", type=float, default=0.8, help="fake LLM time to first token, seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=60)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of LLM calls that fail")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--state-backend", choices=["memory", "sqlite", "redis"],
+                        help="STATE_BACKEND for the server (default: sqlite with several workers, else memory)")
+    parser.add_argument("--url", help="test an already running server instead of starting one")
+    parser.add_argument("--timeout", type=float, default=120, help="HTTP timeout, seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    if args.state_backend is None:
+        args.state_backend = "sqlite" if args.workers > 1 else "memory"
+
+    from schema_index import SchemaIndex
+    with open("questions_schema.json") as f:
+        fields = list(SchemaIndex.from_json(f.read()).fields.values())
+
+    process = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        process, base_url = start_server(args)
+    try:
+        print(f"server={base_url} workers={args.workers} state={args.state_backend} "
+              f"fake_llm_latency={args.latency}s tokens/s={args.tokens_per_second} failure_rate={args.failure_rate}")
+        results = []
+        for sessions in args.sessions:
+            result = asyncio.run(run_level(base_url, sessions, fields, args, process.pid if process else None))
+            print_level(result)
+            results.append(result)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
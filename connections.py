@@ -0,0 +1,312 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryPubSub:
+    """Delivers published session messages to subscribers in this process.
+
+    The registry publishes through this interface instead of writing to
+    sockets directly, so a cross-process implementation (one channel shared
+    by all uvicorn workers) can be dropped in without touching callers.
+    """
+
+    # Whether messages reach sockets held by other processes
+    shared = False
+
+    def __init__(self):
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        """Register `callback(session_id, message)` for every published message."""
+        self._subscribers.append(callback)
+
+    async def publish(self, session_id, message):
+        for callback in self._subscribers:
+            callback(session_id, message)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class SQLitePubSub(InMemoryPubSub):
+    """Session messages shared by the workers on one host through a SQLite file.
+
+    Subscribers in this process get a message immediately; it is also
+    appended to a table that every other worker polls each `poll_interval`
+    seconds. Messages older than `retention_seconds` are purged.
+    """
+
+    shared = True
+
+    def __init__(self, path, poll_interval=0.05, retention_seconds=60.0):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.origin = uuid.uuid4().hex
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._poller = None
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS ws_messages (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "origin TEXT NOT NULL, session_id TEXT NOT NULL, message TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    async def publish(self, session_id, message):
+        await super().publish(session_id, message)
+        await asyncio.to_thread(self._insert, session_id, json.dumps(message))
+
+    def _insert(self, session_id, message_json):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO ws_messages (origin, session_id, message, created_at) VALUES (?, ?, ?, ?)",
+                (self.origin, session_id, message_json, time.time()),
+            )
+            self._db.commit()
+
+    def _fetch(self):
+        """Messages from other workers since the last poll; purges old rows."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, origin, session_id, message FROM ws_messages WHERE id > ? ORDER BY id", (self._last_id,)
+            ).fetchall()
+            if rows:
+                self._last_id = rows[-1][0]
+                self._db.execute("DELETE FROM ws_messages WHERE created_at < ?",
+                                 (time.time() - self.retention_seconds,))
+                self._db.commit()
+        return [(session_id, message) for _, origin, session_id, message in rows if origin != self.origin]
+
+    async def start(self):
+        with self._lock:
+            self._last_id = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM ws_messages").fetchone()[0]
+        self._poller = asyncio.create_task(self._poll_loop())
+
+    async def stop(self):
+        if self._poller is not None:
+            self._poller.cancel()
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                messages = await asyncio.to_thread(self._fetch)
+            except sqlite3.Error as e:
+                logger.warning("Error polling WebSocket messages: %r", e)
+                continue
+            for session_id, message_json in messages:
+                await super().publish(session_id, json.loads(message_json))
+
+
+class RedisPubSub(InMemoryPubSub):
+    """Session messages shared by every worker and node through a Redis channel.
+
+    Needs the optional `redis` package. Subscribers in this process get a
+    message immediately; other processes get it from the channel.
+    """
+
+    shared = True
+
+    def __init__(self, url, channel="onboarding:ws"):
+        super().__init__()
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("STATE_BACKEND=redis needs the redis package: pip install redis") from None
+        self._redis = redis.Redis.from_url(url)
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+        self._listener = None
+
+    async def publish(self, session_id, message):
+        await super().publish(session_id, message)
+        await self._redis.publish(self.channel, json.dumps(
+            {"origin": self.origin, "sessionId": session_id, "message": message}))
+
+    async def start(self):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self.channel)
+        self._listener = asyncio.create_task(self._listen(pubsub))
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+        await self._redis.aclose()
+
+    async def _listen(self, pubsub):
+        async for item in pubsub.listen():
+            try:
+                data = json.loads(item["data"])
+            except (TypeError, ValueError):
+                continue
+            if data.get("origin") != self.origin:
+                await super().publish(data["sessionId"], data["message"])
+
+
+class Connection:
+    """One WebSocket with a bounded outgoing queue drained by its own task."""
+
+    def __init__(self, websocket, session_id, max_queue):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.last_seen = time.monotonic()
+        self.dropped = 0
+        self.sender = None
+
+    def enqueue(self, message_json):
+        """Queue a message without waiting; drops the oldest one when full."""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message_json)
+
+
+class ConnectionRegistry:
+    """WebSocket connections keyed by session, with per-connection backpressure.
+
+    Messages go to the sockets of one session only. Each connection has a
+    queue of at most `max_queue` messages and a sender task, so a slow client
+    never delays other clients or the HTTP request that produced the message;
+    when its queue is full the oldest message is dropped. A heartbeat pings
+    every connection each `ping_interval` seconds and closes those that have
+    not sent anything (e.g. a pong) for `ping_timeout` seconds.
+    """
+
+    def __init__(self, pubsub=None, max_queue=100, send_timeout=10.0, ping_interval=20.0, ping_timeout=60.0):
+        self.pubsub = pubsub or InMemoryPubSub()
+        self.pubsub.subscribe(self.deliver)
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self._sessions = {}
+        self._heartbeat = None
+        self.sent_messages = 0
+        self.dropped_messages = 0
+        self.closed_stale = 0
+
+    async def start(self):
+        await self.pubsub.start()
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+        for connection in self.connections():
+            await self._close(connection)
+        await self.pubsub.stop()
+
+    def register(self, websocket, session_id):
+        """Track an accepted socket and start its sender task."""
+        connection = Connection(websocket, session_id, self.max_queue)
+        connection.sender = asyncio.create_task(self._send_loop(connection))
+        self._sessions.setdefault(session_id, set()).add(connection)
+        return connection
+
+    def unregister(self, connection):
+        connections = self._sessions.get(connection.session_id)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del self._sessions[connection.session_id]
+        self.dropped_messages += connection.dropped
+        connection.dropped = 0
+        if connection.sender is not None and connection.sender is not asyncio.current_task():
+            connection.sender.cancel()
+
+    def touch(self, connection):
+        """Record that the client sent something (pong or any message)."""
+        connection.last_seen = time.monotonic()
+
+    def connections(self, session_id=None):
+        if session_id is not None:
+            return list(self._sessions.get(session_id, ()))
+        return [c for connections in self._sessions.values() for c in connections]
+
+    def has_session(self, session_id):
+        return bool(self._sessions.get(session_id))
+
+    def reachable(self, session_id):
+        """Whether messages for the session may reach a socket.
+
+        With a shared pubsub the socket can be open on another worker, so
+        this is always true; otherwise only this process's sockets count.
+        """
+        return self.pubsub.shared or self.has_session(session_id)
+
+    async def send_to_session(self, session_id, message):
+        """Send a message to the session's sockets, here or on another worker.
+
+        A session with a socket in this process gets it directly, so streamed
+        chunks for local sockets never touch a shared pubsub; only sessions
+        whose sockets are elsewhere are published.
+        """
+        if self.has_session(session_id):
+            self.deliver(session_id, message)
+        else:
+            await self.pubsub.publish(session_id, message)
+
+    def deliver(self, session_id, message):
+        """Queue a published message on this process's sockets for the session."""
+        message_json = json.dumps(message)
+        for connection in self._sessions.get(session_id, ()):
+            connection.enqueue(message_json)
+
+    def stats(self):
+        connections = self.connections()
+        depths = [c.queue.qsize() for c in connections]
+        return {
+            "connections": len(connections),
+            "sessions": len(self._sessions),
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            "sent_messages": self.sent_messages,
+            "dropped_messages": self.dropped_messages + sum(c.dropped for c in connections),
+            "closed_stale": self.closed_stale,
+        }
+
+    async def _send_loop(self, connection):
+        try:
+            while True:
+                message_json = await connection.queue.get()
+                await asyncio.wait_for(connection.websocket.send_text(message_json), self.send_timeout)
+                self.sent_messages += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("❌ Closing WebSocket for session %s: %r", connection.session_id, e)
+            await self._close(connection)
+
+    async def _heartbeat_loop(self):
+        ping = json.dumps({"type": "ping"})
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            cutoff = time.monotonic() - self.ping_timeout
+            for connection in self.connections():
+                if connection.last_seen < cutoff:
+                    self.closed_stale += 1
+                    await self._close(connection)
+                else:
+                    connection.enqueue(ping)
+
+    async def _close(self, connection):
+        self.unregister(connection)
+        try:
+            await connection.websocket.close()
+        except Exception:
+            pass
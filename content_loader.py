@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ContentSnapshot:
+    """One consistent set of prompt content: file texts plus what was built from them.
+
+    `version` is a hash of the file contents, so every worker that loads the
+    same files agrees on it. `built` is whatever the loader's build function
+    returned (prompt builder, schema index, ...).
+    """
+
+    def __init__(self, version, texts, built, mtimes):
+        self.version = version
+        self.texts = texts
+        self.built = built
+        self.mtimes = mtimes
+        self.loaded_at = time.time()
+
+
+class ContentLoader:
+    """Loads prompt content files and reloads them when they change on disk.
+
+    `paths` maps a name to a file path; `build(texts)` turns the file texts
+    into the objects requests use and may raise to reject bad content (e.g.
+    invalid JSON), in which case the previous snapshot stays in use. The
+    current snapshot is replaced in one assignment, so a request sees either
+    the old content or the new, never a mix. `listeners` are called with each
+    new snapshot.
+    """
+
+    def __init__(self, paths, build, poll_interval=2.0):
+        self.paths = paths
+        self.build = build
+        self.poll_interval = poll_interval
+        self.listeners = []
+        self.reloads = 0
+        self.failures = 0
+        self._snapshot = None
+        # Files as they were when a reload last failed, so it is not retried
+        # (and logged) every poll until they change again
+        self._failed_mtimes = None
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    @property
+    def current(self):
+        """The current snapshot, loading the files on first use."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._install(self._read())
+            snapshot = self._snapshot
+        return snapshot
+
+    def _mtimes(self):
+        return {name: os.stat(path).st_mtime_ns for name, path in self.paths.items()}
+
+    def _read(self):
+        mtimes = self._mtimes()
+        texts = {}
+        for name, path in self.paths.items():
+            with open(path, "r") as f:
+                texts[name] = f.read().strip()
+        digest = hashlib.sha256()
+        for name in sorted(texts):
+            digest.update(f"{name}\0{texts[name]}\0".encode("utf-8"))
+        return digest.hexdigest()[:16], texts, mtimes
+
+    def _install(self, loaded):
+        version, texts, mtimes = loaded
+        snapshot = ContentSnapshot(version, texts, self.build(texts), mtimes)
+        self._snapshot = snapshot
+        for listener in self.listeners:
+            listener(snapshot)
+        return snapshot
+
+    def reload(self, force=False):
+        """Reload if any file changed; `force` rebuilds even unchanged content (e.g. after a settings change)."""
+        with self._lock:
+            current = self._snapshot
+            mtimes = None
+            try:
+                mtimes = self._mtimes()
+                if not force and current is not None and mtimes in (current.mtimes, self._failed_mtimes):
+                    return False
+                loaded = self._read()
+                if not force and current is not None and loaded[0] == current.version:
+                    # Touched but identical; remember the new mtimes only
+                    current.mtimes = loaded[2]
+                    return False
+                snapshot = self._install(loaded)
+                self._failed_mtimes = None
+            except Exception as e:
+                self._failed_mtimes = mtimes
+                self.failures += 1
+                logger.error("Keeping content version %s, reload failed: %r",
+                             current.version if current else None, e)
+                return False
+        if current is not None:
+            self.reloads += 1
+        logger.info("Loaded content version %s", snapshot.version)
+        return True
+
+    async def start(self):
+        """Check the files every `poll_interval` seconds in the background (0 disables)."""
+        if self.poll_interval > 0 and self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            # Parsing and rebuilding runs off the event loop
+            await asyncio.to_thread(self.reload)
@@ -0,0 +1,116 @@
+import math
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+SUMMARY_PROMPT = """Progressively summarize the onboarding conversation below, adding the new lines to the current summary.
+Keep what the user asked, preferences they stated (e.g. Smart Guide or Manual mode) and open questions.
+Do not record form field values: the current form state is sent separately with every request and is authoritative.
+Reply with the new summary only, in at most 120 words.
+
+Current summary:
+{summary}
+
+New lines:
+{lines}
+
+New summary:"""
+
+
+def estimate_tokens(text):
+    """Rough token estimate (~4 characters per token) used for budgeting."""
+    return math.ceil(len(text) / 4) if text else 0
+
+
+class ConversationMemory:
+    """Conversation history bounded by a turn count and a token budget.
+
+    The most recent turns are kept verbatim (at most `max_turns`, and no more
+    than fit in `max_tokens` together with the summary). Older turns are
+    returned by turns_to_fold() so the agent can fold them into `summary`
+    with the LLM, then drop them with fold().
+    """
+
+    def __init__(self, max_turns=6, max_tokens=1500):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.summary = ""
+        self.turns = []  # [(human, ai), ...], oldest first
+        self.total_turns = 0
+        # What the history would cost if every full prompt were resent (old behaviour)
+        self.full_history_tokens = 0
+        self.folding = False
+
+    @property
+    def messages(self):
+        """Verbatim recent turns as chat messages."""
+        messages = []
+        for human, ai in self.turns:
+            messages.append(HumanMessage(content=human))
+            messages.append(AIMessage(content=ai))
+        return messages
+
+    def history_tokens(self):
+        """Estimated tokens of summary + verbatim turns."""
+        return estimate_tokens(self.summary) + sum(
+            estimate_tokens(human) + estimate_tokens(ai) for human, ai in self.turns
+        )
+
+    def save_turn(self, human, ai, prompt=None):
+        """Record a turn. `prompt` is the full text sent, if different from `human`."""
+        ai = ai or ""
+        self.turns.append((human, ai))
+        self.total_turns += 1
+        self.full_history_tokens += estimate_tokens(prompt or human) + estimate_tokens(ai)
+
+    def turns_to_fold(self):
+        """Oldest turns to fold into the summary, or [] while within limits.
+
+        Once the turn limit or token budget is exceeded, history is cut down
+        to half of both so summarization runs in batches, not on every turn.
+        """
+        budget = self.max_tokens - estimate_tokens(self.summary)
+        if len(self.turns) <= self.max_turns and self.history_tokens() <= self.max_tokens:
+            return []
+        max_kept = max(1, self.max_turns // 2)
+        used = 0
+        kept = 0
+        for human, ai in reversed(self.turns):
+            cost = estimate_tokens(human) + estimate_tokens(ai)
+            # Always keep the latest turn, even if it alone exceeds the budget
+            if kept >= max_kept or (kept > 0 and used + cost > budget // 2):
+                break
+            used += cost
+            kept += 1
+        return self.turns[:len(self.turns) - kept]
+
+    def summary_prompt(self, turns):
+        """Prompt asking the LLM to fold `turns` into the current summary."""
+        lines = "\n".join(f"User: {human}\nAssistant: {ai}" for human, ai in turns)
+        return SUMMARY_PROMPT.format(summary=self.summary or "(none)", lines=lines)
+
+    def fold(self, turns, summary):
+        """Drop the given oldest turns and replace the summary.
+
+        Returns False, changing nothing, if they are no longer the oldest
+        turns (another worker folded them first).
+        """
+        if self.turns[:len(turns)] != list(turns):
+            return False
+        del self.turns[:len(turns)]
+        self.summary = (summary or "").strip()
+        return True
+
+    def to_dict(self):
+        return {
+            "summary": self.summary,
+            "turns": [list(turn) for turn in self.turns],
+            "total_turns": self.total_turns,
+            "full_history_tokens": self.full_history_tokens,
+        }
+
+    def load_dict(self, data):
+        self.summary = data.get("summary", "")
+        self.turns = [tuple(turn) for turn in data.get("turns", [])]
+        self.total_turns = data.get("total_turns", len(self.turns))
+        self.full_history_tokens = data.get("full_history_tokens", 0)
+        return self
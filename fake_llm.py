@@ -0,0 +1,88 @@
+import os
+import random
+import re
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from conversation_memory import estimate_tokens
+from prompt_builder import content_text
+
+DEFAULT_ANSWER = (
+    "Great! The source application name is the system that currently sends these files, for example "
+    "a payroll or billing application. Let me know if you have any other questions about this section."
+)
+
+_PIECE = re.compile(r"\S+\s*")
+
+
+class FakeLLMError(RuntimeError):
+    """Failure injected by FakeChatModel (stands in for throttling or service errors)."""
+
+
+class FakeChatModel(BaseChatModel):
+    """Local stand-in for ChatBedrock, for benchmarks and load tests.
+
+    Like ChatBedrock it answers with blocking calls that langchain runs in the
+    default executor. Each call waits `latency` seconds before the first
+    token, then produces the answer at `tokens_per_second`, streamed word by
+    word; a `failure_rate` fraction of calls raise FakeLLMError instead.
+    Responses carry usage metadata estimated from the prompt and answer.
+    """
+
+    latency: float = 0.8
+    tokens_per_second: float = 60.0
+    failure_rate: float = 0.0
+    answer: str = DEFAULT_ANSWER
+    seed: int | None = None
+    calls: int = 0
+    failures: int = 0
+
+    @classmethod
+    def from_env(cls):
+        """Configure from FAKE_LLM_LATENCY, FAKE_LLM_TOKENS_PER_SECOND and FAKE_LLM_FAILURE_RATE."""
+        return cls(
+            latency=float(os.getenv("FAKE_LLM_LATENCY", "0.8")),
+            tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "60")),
+            failure_rate=float(os.getenv("FAKE_LLM_FAILURE_RATE", "0")),
+        )
+
+    def model_post_init(self, context):
+        self._random = random.Random(self.seed)
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        # Tools are accepted so the form-update path runs, but never called
+        return self.bind(tools=tools, **kwargs)
+
+    def _start(self, messages):
+        """Count the call, wait for the first token and maybe fail."""
+        self.calls += 1
+        time.sleep(self.latency)
+        if self._random.random() < self.failure_rate:
+            self.failures += 1
+            raise FakeLLMError("Injected failure (ThrottlingException)")
+        return sum(estimate_tokens(content_text(m.content)) for m in messages)
+
+    def _usage(self, input_tokens):
+        output_tokens = estimate_tokens(self.answer)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        input_tokens = self._start(messages)
+        time.sleep(estimate_tokens(self.answer) / self.tokens_per_second)
+        message = AIMessage(content=self.answer, usage_metadata=self._usage(input_tokens))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        input_tokens = self._start(messages)
+        for piece in _PIECE.findall(self.answer):
+            time.sleep(estimate_tokens(piece) / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(input_tokens)))
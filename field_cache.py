@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Prompt used to explain a single field. It only depends on the field and the
+# schema, so its answers are cached per (field path, schema, prompt template).
+FIELD_CONTEXT_PROMPT = """
+FIELD CONTEXT REQUEST:
+The user is focusing on the field: \"{field_label}\" (path: {field_name})
+
+Provide helpful context about the \"{field_label}\" field. Explain what it's for, mention any requirements, and give examples if helpful. Be specific and mention the field name explicitly instead of saying \"This field\". Keep it natural and under 2 sentences.
+"""
+
+
+def content_hash(text):
+    """Short, stable hash of some content, used in cache keys."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class LRUCacheBackend:
+    """In-process LRU cache (per worker)."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, version):
+        with self._lock:
+            self._entries[key] = (value, version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, version):
+        """Drop every entry not written for `version`."""
+        with self._lock:
+            for key in [k for k, (_, v) in self._entries.items() if v != version]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """Cache in a SQLite file, shared by all workers on a host and kept across restarts."""
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS field_context ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, version TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT value, version FROM field_context WHERE key = ?", (key,)).fetchone()
+        return tuple(row) if row else None
+
+    def set(self, key, value, version):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO field_context (key, value, version, created_at) VALUES (?, ?, ?, ?)",
+                (key, value, version, time.time()),
+            )
+            self._db.commit()
+
+    def invalidate(self, version):
+        """Drop every entry not written for `version`."""
+        with self._lock:
+            self._db.execute("DELETE FROM field_context WHERE version != ?", (version,))
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM field_context").fetchone()[0]
+
+
+class FieldContextCache:
+    """Field-context answers keyed by (field path, schema hash, prompt template hash).
+
+    The agent calls set_content() whenever it (re)loads the schema and system
+    prompt; entries written for older content are invalidated.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+
+    def set_content(self, schema_text, prompt_template_text):
+        """Record the current schema/prompt template and drop stale entries."""
+        version = f"{content_hash(schema_text)}:{content_hash(prompt_template_text + FIELD_CONTEXT_PROMPT)}"
+        if version != self.version:
+            self.version = version
+            self.backend.invalidate(version)
+
+    def key(self, field_name, field_label):
+        return f"{self.version}:{field_name}:{field_label}"
+
+    def get(self, field_name, field_label):
+        entry = self.backend.get(self.key(field_name, field_label))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def set(self, field_name, field_label, answer):
+        if answer is not None:
+            self.backend.set(self.key(field_name, field_label), answer, self.version)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def main():
+    """Precompute field context for every leaf in questions_schema.json.
+
+    Only useful with a persistent backend, so FIELD_CACHE_PATH must be set
+    (the server reads the same file), and with FIELD_HELP_MODE=llm, the only
+    mode that serves schema fields from the cache.
+    """
+    parser = argparse.ArgumentParser(description="Field-context cache tools")
+    parser.add_argument("command", choices=["warm", "stats"])
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel LLM calls while warming")
+    args = parser.parse_args()
+
+    # Run as a script this module is __main__, so agent's backend classes
+    # are not the ones defined above; check the setting instead
+    if not os.getenv("FIELD_CACHE_PATH"):
+        parser.error("set FIELD_CACHE_PATH so the warmed cache outlives this process")
+    import agent
+
+    if args.command == "warm" and agent.FIELD_HELP_MODE != "llm":
+        print(f"FIELD_HELP_MODE={agent.FIELD_HELP_MODE}: schema fields are answered from templates, "
+              "nothing to warm (set FIELD_HELP_MODE=llm)")
+    elif args.command == "warm":
+        warmed = asyncio.run(agent.warm_field_cache(concurrency=args.concurrency))
+        print(f"Warmed {warmed} field(s)")
+    print(json.dumps(agent.get_field_cache().stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
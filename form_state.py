@@ -0,0 +1,161 @@
+from prompt_builder import minify_json, words
+
+
+class FormVersionConflict(Exception):
+    """A patch was based on an older version of the form than the server has."""
+
+    def __init__(self, version):
+        super().__init__(f"Form state is at version {version}")
+        self.version = version
+
+
+def has_meaningful_form_content(form_data):
+    """Check if form data contains meaningful content beyond empty fields"""
+    # Handle None/null
+    if form_data is None:
+        return False
+
+    # Handle strings - meaningful if not empty after stripping
+    if isinstance(form_data, str):
+        return len(form_data.strip()) > 0
+
+    # Handle numbers - meaningful if not 0 (though 0 could be meaningful in some contexts)
+    if isinstance(form_data, (int, float)):
+        return form_data != 0
+
+    # Handle booleans - meaningful if True (False is typically default)
+    if isinstance(form_data, bool):
+        return form_data is True
+
+    # Handle lists/arrays - meaningful if not empty and contains meaningful values
+    if isinstance(form_data, list):
+        return len(form_data) > 0 and any(has_meaningful_form_content(item) for item in form_data)
+
+    # Handle dictionaries/objects - meaningful if any property has meaningful value
+    if isinstance(form_data, dict):
+        return any(has_meaningful_form_content(prop) for prop in form_data.values())
+
+    # For any other type, consider it meaningful if it exists
+    return True
+
+
+def is_cleared(value):
+    """True for values that mean "no answer": None, blank text, or a list of those.
+
+    Unlike has_meaningful_form_content, False and 0 are answers here (a "No"
+    to a yes/no field is still filled in).
+    """
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return not value.strip()
+    if isinstance(value, list):
+        return all(is_cleared(item) for item in value)
+    return False
+
+
+def flatten(form_data, prefix=""):
+    """Nested form data -> {dotted path: leaf value}; lists are leaf values."""
+    flat = {}
+    for name, value in (form_data or {}).items():
+        path = f"{prefix}.{name}" if prefix else name
+        if isinstance(value, dict):
+            flat.update(flatten(value, path))
+        else:
+            flat[path] = value
+    return flat
+
+
+class FormState:
+    """A session's form, kept on the server and updated by versioned patches.
+
+    Values are stored by dotted field path; cleared ones (see is_cleared) are
+    dropped, while False and 0 are kept as answers. Every accepted patch bumps `version`; clients
+    send the version their patch is based on and resend the whole form on a
+    conflict. `sent` is what the model has been shown in this conversation,
+    so prompts only need fields that changed since, plus the relevant ones.
+    """
+
+    def __init__(self, values=None, version=0, sent=None):
+        self.values = values or {}
+        self.version = version
+        self.sent = sent or {}
+
+    @property
+    def has_content(self):
+        """Whether the form has anything beyond defaults, as for a loaded form."""
+        return has_meaningful_form_content(self.values)
+
+    def apply(self, patch, base_version=None, replace=False):
+        """Apply {path: value} (nested dicts are flattened) and return the new version.
+
+        With `replace` the patch is the whole form and no version check is
+        done; otherwise a `base_version` other than the current one raises
+        FormVersionConflict.
+        """
+        if not replace and base_version is not None and base_version != self.version:
+            raise FormVersionConflict(self.version)
+        if replace:
+            self.values = {}
+        for path, value in flatten(patch).items():
+            if is_cleared(value):
+                self.values.pop(path, None)
+            else:
+                self.values[path] = value
+        self.version += 1
+        return self.version
+
+    def changes(self):
+        """{path: value} changed since the model last saw the form; cleared fields map to None."""
+        changed = {path: value for path, value in self.values.items() if self.sent.get(path) != value}
+        changed.update({path: None for path in self.sent if path not in self.values})
+        return changed
+
+    def mark_sent(self, changes):
+        """Record that the model has seen `changes` (from prompt_context)."""
+        for path, value in changes.items():
+            if value is None:
+                self.sent.pop(path, None)
+            else:
+                self.sent[path] = value
+
+    def forget_sent(self):
+        """Show the whole form again next time (e.g. the turns that carried it were summarized)."""
+        self.sent = {}
+
+    def prompt_context(self, query=None):
+        """Form state for a prompt, as (text, changes).
+
+        The text has the fields changed since the last prompt and the filled
+        fields relevant to `query` (a field path: its section; a question:
+        fields whose name shares a word with it, as section names all end in
+        "Info"). Once the model has answered, `changes` should be saved in the
+        conversation history and passed to mark_sent(), since they are not
+        sent again.
+        """
+        changes = self.changes()
+        relevant = {}
+        if query:
+            is_path = "." in query and " " not in query.strip()
+            section = query.split(".", 1)[0]
+            query_words = set(words(query))
+            for path, value in self.values.items():
+                if path in changes:
+                    continue
+                if (path.split(".", 1)[0] == section if is_path
+                        else query_words & set(words(path.rsplit(".", 1)[-1]))):
+                    relevant[path] = value
+
+        parts = [f"Form: {len(self.values)} field(s) filled."]
+        if changes:
+            parts.append(f"Changed since the last message: {minify_json(changes)}.")
+        if relevant:
+            parts.append(f"Related current values: {minify_json(relevant)}.")
+        return " ".join(parts), changes
+
+    def to_dict(self):
+        return {"values": self.values, "version": self.version, "sent": self.sent}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("values"), data.get("version", 0), data.get("sent"))
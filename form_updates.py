@@ -0,0 +1,63 @@
+from prompt_builder import content_text
+from schema_index import render_field_updated
+
+# Offered to the model on ask-agent turns. A tool call arrives as structured
+# arguments next to the answer text, so nothing has to be parsed out of prose.
+FORM_UPDATE_TOOL = {
+    "name": "update_form_field",
+    "description": (
+        "Fill in one onboarding form field with a value the user stated in the chat. "
+        "Call it once per field; do not call it for values the user did not give."
+    ),
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "name": {
+                "type": "string",
+                "description": "Dotted schema path of the field, e.g. networkCloudInfo.cloudDetails.awsAccountNumber",
+            },
+            "value": {
+                "description": "The value: text, true/false for yes/no fields, a list for multi-select fields",
+            },
+        },
+        "required": ["name", "value"],
+    },
+}
+
+
+class AgentReply:
+    """An ask-agent answer plus the form updates that passed schema validation."""
+
+    def __init__(self, answer="", form_updates=None, rejected=None):
+        self.answer = answer
+        # [{"name": path, "value": value}], the payload the client applies
+        self.form_updates = form_updates or []
+        # [(tool arguments, error)] for updates that failed validation
+        self.rejected = rejected or []
+
+    def memory_text(self):
+        """The answer as stored in history, noting fields that were filled in."""
+        notes = "".join(f"\n[Form updated: {u['name']} = {u['value']!r}]" for u in self.form_updates)
+        return self.answer + notes
+
+
+def parse_reply(response, schema_index, reply=None):
+    """Build an AgentReply from a model message with optional tool calls."""
+    reply = reply if reply is not None else AgentReply()
+    reply.answer = content_text(response.content).strip()
+    confirmations = []
+    for call in getattr(response, "tool_calls", None) or []:
+        if call.get("name") != FORM_UPDATE_TOOL["name"]:
+            continue
+        args = call.get("args") or {}
+        try:
+            field, value = schema_index.validate(args.get("name", ""), args.get("value"))
+        except ValueError as e:
+            reply.rejected.append((args, str(e)))
+            continue
+        reply.form_updates.append({"name": args["name"], "value": value})
+        confirmations.append(render_field_updated(field, value))
+    # The model may call the tool without saying anything
+    if not reply.answer and confirmations:
+        reply.answer = " ".join(confirmations)
+    return reply
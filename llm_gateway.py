@@ -0,0 +1,350 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+
+import metrics
+from conversation_memory import estimate_tokens
+from prompt_builder import content_text
+
+logger = logging.getLogger(__name__)
+
+# Bedrock error codes worth retrying. ChatBedrock re-raises boto3 errors as
+# ValueError("Error raised by bedrock service: ..."), so the code is matched
+# in the message as well as on botocore ClientErrors.
+RETRYABLE_ERRORS = (
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+    "InternalServerException",
+)
+
+# Errors on the model's side that count toward opening a circuit breaker, in
+# addition to the retryable ones. Anything else (e.g. a ValidationException
+# for an oversized prompt) is specific to one request and only re-raised.
+SERVICE_ERRORS = RETRYABLE_ERRORS + (
+    "ModelTimeoutException",
+    "ModelErrorException",
+    "ModelStreamErrorException",
+    "EndpointConnectionError",
+    "ConnectTimeoutError",
+    "ReadTimeoutError",
+)
+
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+RETRIES = metrics.counter("llm_retries_total", "LLM calls retried after throttling or a transient error", ["model"])
+COALESCED = metrics.counter("llm_coalesced_total", "LLM requests answered by an identical request already in flight")
+RATE_LIMIT_WAIT = metrics.counter("llm_rate_limit_wait_seconds_total", "Time LLM calls waited for the rate limiter")
+FAST_MODEL_REQUESTS = metrics.counter("llm_fast_model_requests_total", "Requests served by the fast model", ["reason"])
+CIRCUIT_OPENED = metrics.counter("llm_circuit_opened_total", "Times a model's circuit breaker opened", ["model"])
+
+
+class CircuitOpenError(RuntimeError):
+    """No model can take the request because their circuit breakers are open."""
+
+
+def is_retryable(error):
+    """Whether an LLM error is throttling or a transient service error."""
+    response = getattr(error, "response", None)
+    code = response.get("Error", {}).get("Code", "") if isinstance(response, dict) else ""
+    text = f"{code} {error}"
+    return any(name in text for name in RETRYABLE_ERRORS)
+
+
+def is_service_error(error):
+    """Whether an LLM error says the model is failing, not that the request was bad."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        if response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0) >= 500:
+            return True
+        code = response.get("Error", {}).get("Code", "")
+    else:
+        code = ""
+    text = f"{type(error).__name__} {code} {error}"
+    return any(name in text for name in SERVICE_ERRORS)
+
+
+class TokenBucket:
+    """Allows `rate` units per second on average, in bursts of up to `capacity`.
+
+    Callers reserve units and then wait the returned delay, so waiting works
+    the same from threads and coroutines and callers are served in order.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, cost=1):
+        """Take `cost` units; returns the seconds to wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= min(cost, self.capacity)
+            return max(0.0, -self._tokens / self.rate)
+
+
+class CircuitBreaker:
+    """Stops sending requests to a model after repeated failures.
+
+    Opens after `failure_threshold` consecutive failed calls. After
+    `reset_timeout` seconds it is half-open: calls are let through again, the
+    first success closes it and the first failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        return self.state != "open"
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    CIRCUIT_OPENED.inc(model=self.name)
+                    logger.warning("LLM circuit breaker for '%s' opened after %d failure(s)", self.name, self.failures)
+                self._opened_at = time.monotonic()
+
+
+class ModelClient:
+    """A chat model with its circuit breaker and tool-bound variants."""
+
+    def __init__(self, name, llm, breaker):
+        self.name = name
+        self.llm = llm
+        self.breaker = breaker
+        self._bound = {}
+
+    def runnable(self, tools=None):
+        """The model with `tools` bound; models without tool support are used as is."""
+        if not tools:
+            return self.llm
+        key = tuple(tool["name"] for tool in tools)
+        if key not in self._bound:
+            try:
+                self._bound[key] = self.llm.bind_tools(tools)
+            except (AttributeError, NotImplementedError):
+                self._bound[key] = self.llm
+        return self._bound[key]
+
+
+class LLMGateway:
+    """Every LLM call goes through here.
+
+    - At most `max_concurrency` async calls run at once.
+    - Identical async requests already in flight share one call (coalescing);
+      the call is cancelled once every caller waiting for it has given up.
+    - Throttling and transient errors are retried with jittered exponential
+      backoff ("full jitter"), up to `max_retries` times.
+    - Token buckets keep requests and input tokens per minute under the
+      account quota (0 disables a limit).
+    - Requests marked `fast` (short confirmations, summaries) go to the fast
+      model when one is configured; it also takes over while the primary
+      model's circuit breaker is open. Only service-side errors count toward
+      opening a breaker (see is_service_error).
+    """
+
+    def __init__(self, max_concurrency=8, max_retries=3, backoff_base=0.5, backoff_max=8.0, requests_per_minute=0,
+                 tokens_per_minute=0, breaker_failures=5, breaker_reset_seconds=30.0):
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Buckets hold ten seconds' worth of quota
+        self.request_bucket = (TokenBucket(requests_per_minute / 60, max(1.0, requests_per_minute / 6))
+                               if requests_per_minute else None)
+        self.token_bucket = (TokenBucket(tokens_per_minute / 60, max(1.0, tokens_per_minute / 6))
+                             if tokens_per_minute else None)
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self.primary = None
+        self.fast = None
+        self._breakers = {}
+        self._in_flight = {}
+        # In-flight task -> number of callers awaiting it
+        self._waiters = {}
+        metrics.gauge("llm_circuit_state", "Circuit breaker state per model (0 closed, 1 half-open, 2 open)",
+                      ["model"], callback=self._circuit_states)
+
+    def set_models(self, primary, fast=None, primary_name="primary", fast_name="fast"):
+        """Install the models; breakers are kept per name across reloads."""
+        self.primary = ModelClient(primary_name, primary, self._breaker(primary_name))
+        self.fast = ModelClient(fast_name, fast, self._breaker(fast_name)) if fast is not None else None
+
+    def _slots(self):
+        # Created on first use, inside the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _breaker(self, name):
+        if name not in self._breakers:
+            self._breakers[name] = CircuitBreaker(name, self.breaker_failures, self.breaker_reset_seconds)
+        return self._breakers[name]
+
+    def _circuit_states(self):
+        return {(name,): CIRCUIT_STATES[breaker.state] for name, breaker in self._breakers.items()}
+
+    def _choose(self, fast):
+        """Pick the model for one attempt."""
+        candidates = [self.fast, self.primary] if fast else [self.primary, self.fast]
+        for client in candidates:
+            if client is not None and client.breaker.allow():
+                if client is self.fast:
+                    FAST_MODEL_REQUESTS.inc(reason="fast" if fast else "circuit_open")
+                return client
+        raise CircuitOpenError("The language model is unavailable (circuit breaker open)")
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _reserve(self, messages):
+        """Seconds to wait before this request fits the rate limits."""
+        wait = 0.0
+        if self.request_bucket is not None:
+            wait = max(wait, self.request_bucket.reserve(1))
+        if self.token_bucket is not None:
+            tokens = sum(estimate_tokens(content_text(m.content)) for m in messages)
+            wait = max(wait, self.token_bucket.reserve(tokens))
+        if wait:
+            RATE_LIMIT_WAIT.inc(wait)
+        return wait
+
+    def _should_retry(self, client, error, attempt):
+        if attempt >= self.max_retries or not is_retryable(error):
+            return False
+        RETRIES.inc(model=client.name)
+        logger.warning("LLM call to '%s' failed (%r), retry %d/%d", client.name, error, attempt + 1, self.max_retries)
+        return True
+
+    def invoke(self, messages, tools=None, fast=False):
+        """Blocking call with rate limiting, retries and fallback."""
+        attempt = 0
+        while True:
+            time.sleep(self._reserve(messages))
+            client = self._choose(fast)
+            try:
+                response = client.runnable(tools).invoke(messages)
+            except Exception as e:
+                if self._should_retry(client, e, attempt):
+                    attempt += 1
+                    time.sleep(self._backoff(attempt))
+                    continue
+                if is_service_error(e):
+                    client.breaker.record_failure()
+                raise
+            client.breaker.record_success()
+            return response
+
+    async def ainvoke(self, messages, tools=None, fast=False):
+        """Async call; identical requests in flight are coalesced into one."""
+        key = self._request_key(messages, tools, fast)
+        task = self._in_flight.get(key)
+        if task is not None:
+            COALESCED.inc()
+        else:
+            task = asyncio.ensure_future(self._ainvoke(messages, tools, fast))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        # A caller that times out must not cancel the call for the others,
+        # but once the last one gives up the call (and its retries) stops
+        # holding a concurrency slot
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    # Later identical requests start a new call
+                    if self._in_flight.get(key) is task:
+                        del self._in_flight[key]
+                    task.cancel()
+
+    def _finish(self, key, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the error as retrieved if every caller gave up waiting
+        if not task.cancelled():
+            task.exception()
+
+    async def _ainvoke(self, messages, tools, fast):
+        attempt = 0
+        while True:
+            await asyncio.sleep(self._reserve(messages))
+            client = self._choose(fast)
+            try:
+                async with self._slots():
+                    response = await client.runnable(tools).ainvoke(messages)
+            except Exception as e:
+                if self._should_retry(client, e, attempt):
+                    attempt += 1
+                    await asyncio.sleep(self._backoff(attempt))
+                    continue
+                if is_service_error(e):
+                    client.breaker.record_failure()
+                raise
+            client.breaker.record_success()
+            return response
+
+    async def astream(self, messages, tools=None, fast=False):
+        """Stream a response; retried only if it fails before the first chunk."""
+        attempt = 0
+        while True:
+            await asyncio.sleep(self._reserve(messages))
+            client = self._choose(fast)
+            started = False
+            try:
+                async with self._slots():
+                    async for chunk in client.runnable(tools).astream(messages):
+                        started = True
+                        yield chunk
+            except Exception as e:
+                if not started and self._should_retry(client, e, attempt):
+                    attempt += 1
+                    await asyncio.sleep(self._backoff(attempt))
+                    continue
+                if is_service_error(e):
+                    client.breaker.record_failure()
+                raise
+            client.breaker.record_success()
+            return
+
+    @staticmethod
+    def _request_key(messages, tools, fast):
+        payload = json.dumps([[m.type, m.content] for m in messages], sort_keys=True, default=str)
+        tool_names = ",".join(tool["name"] for tool in tools or ())
+        return hashlib.sha256(f"{fast}|{tool_names}|{payload}".encode("utf-8")).hexdigest()
@@ -0,0 +1,37 @@
+import atexit
+import logging
+import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener = None
+
+
+def setup_logging(level=None):
+    """Send log records through a queue to a background thread that writes them.
+
+    Request handlers merge the message arguments (QueueHandler.prepare, so
+    mutable arguments are captured as they were) and put the record on the
+    queue; the LOG_FORMAT line and the stdout write happen on the listener
+    thread. The level comes from LOG_LEVEL (default INFO); debug records are
+    dropped before any message formatting when it is higher. Safe to call
+    more than once.
+    """
+    global _listener
+    level = level or os.getenv("LOG_LEVEL", "INFO").upper()
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    records = queue.SimpleQueue()
+    root.addHandler(QueueHandler(records))
+    _listener = QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    # Flush queued records on exit
+    atexit.register(_listener.stop)
@@ -1,12 +1,30 @@
-from fastapi import FastAPI, WebSocket, Request
+from fastapi import FastAPI, WebSocket, Request, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-import json
-import re
-from agent import ask_agent
-import random
-from urllib.parse import unquote
+import asyncio
+import logging
+import time
+from agent import (ask_agent_async, ask_agent_reply_async, stream_agent, install_llm_executor, get_session_async,
+                   update_session_async, get_field_context_async, get_field_updated_message, get_schema_index,
+                   remember_turn_async, warm_field_cache, get_content, start_content_watch, stop_content_watch,
+                   STATE_BACKEND, STATE_SQLITE_PATH, REDIS_URL)
+from session_store import new_session_id
+from connections import ConnectionRegistry, InMemoryPubSub, RedisPubSub, SQLitePubSub
+from form_updates import AgentReply
+from form_state import FormVersionConflict
+from prompt_builder import minify_json
+from logging_setup import setup_logging
+import metrics
+import os
+
+# Leveled logging through a background thread (LOG_LEVEL, default INFO)
+setup_logging()
+logger = logging.getLogger(__name__)
+
+HTTP_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by endpoint", ["method", "endpoint", "status"])
+FORM_UPDATES = metrics.counter("form_updates_total", "Form updates from chat tool calls", ["outcome"])
 
 # Initialize FastAPI application
 app = FastAPI()
@@ -20,189 +38,315 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # The route template (e.g. /api/ask-agent/{prompt}) keeps label values bounded
+        route = request.scope.get("route")
+        HTTP_SECONDS.observe(time.perf_counter() - start, method=request.method,
+                             endpoint=getattr(route, "path", "unmatched"), status=str(status))
+
+
+@app.on_event("startup")
+async def startup():
+    install_llm_executor()
+    get_schema_index()  # load the schema and prompt before the first request
+    # Pick up edits to SYSTEM_PROMPT.md, KNOWLEDGEBASE.md and the schema
+    await start_content_watch()
+    await registry.start()
+    # Optionally precompute field context in the background
+    if os.getenv("FIELD_CACHE_WARM_ON_STARTUP"):
+        app.state.warm_task = asyncio.create_task(warm_field_cache())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stop_content_watch()
+    await registry.stop()
+
+def create_pubsub():
+    """Channel for session messages; shared across workers unless STATE_BACKEND=memory."""
+    if STATE_BACKEND == "sqlite":
+        return SQLitePubSub(STATE_SQLITE_PATH, poll_interval=float(os.getenv("WS_POLL_INTERVAL", "0.05")))
+    if STATE_BACKEND == "redis":
+        return RedisPubSub(REDIS_URL)
+    return InMemoryPubSub()
+
+
 # items = []
-connected_clients = []
-form_data = {}
-agent_session_id = str(random.randint(10000000, 99999999))
+# WebSocket connections per session, each with a bounded send queue
+registry = ConnectionRegistry(
+    pubsub=create_pubsub(),
+    max_queue=int(os.getenv("WS_MAX_QUEUE", "100")),
+    ping_interval=float(os.getenv("WS_PING_INTERVAL", "20")),
+    ping_timeout=float(os.getenv("WS_PING_TIMEOUT", "60")),
+)
+
+metrics.gauge("websocket_connections", "Open WebSocket connections", callback=lambda: registry.stats()["connections"])
+metrics.gauge("websocket_sessions", "Sessions with an open WebSocket", callback=lambda: registry.stats()["sessions"])
+metrics.gauge("websocket_queue_depth", "Messages waiting in WebSocket send queues",
+              callback=lambda: registry.stats()["queue_depth_total"])
+metrics.counter("websocket_sent_messages_total", "Messages sent over WebSockets",
+                callback=lambda: registry.sent_messages)
+metrics.counter("websocket_dropped_messages_total", "Messages dropped from full WebSocket queues",
+                callback=lambda: registry.stats()["dropped_messages"])
+metrics.counter("websocket_closed_stale_total", "WebSockets closed by the heartbeat",
+                callback=lambda: registry.closed_stale)
+
+
+# Shown when the LLM could not answer, even after retries
+UNAVAILABLE_MESSAGE = "The assistant is unavailable, please try again."
+
+# Welcome messages used when the LLM cannot write one, so a session still starts
+FALLBACK_WELCOME = ("Welcome to customer onboarding! Would you like assistance with the process? "
+                    "You can ask questions in the chat at any time.")
+FALLBACK_WELCOME_BACK = "Welcome back! Your saved form data is loaded and I'm ready to help."
+
+
+def require_session_id(session_id):
+    """Return the client's session ID, rejecting requests that did not send one."""
+    if not session_id:
+        raise HTTPException(status_code=400, detail="sessionId is required; call /api/start-agent first")
+    return session_id
+
+
+def require_answer(answer):
+    """Return an LLM answer, or fail the request with 503 if there is none."""
+    if answer is None:
+        raise HTTPException(status_code=503, detail=UNAVAILABLE_MESSAGE)
+    return answer
+
+
+async def stream_answer(context_prompt, session_id, memory_text, request_id, schema_query=None):
+    """Stream an answer to the session's sockets as chat-chunk messages.
+
+    Returns the AgentReply, or None if the LLM call failed.
+    """
+    reply = AgentReply()
+    try:
+        async for chunk in stream_agent(context_prompt, session_id=session_id, memory_text=memory_text,
+                                        schema_query=schema_query, reply=reply):
+            await registry.send_to_session(session_id, {
+                "type": "chat-chunk", "requestId": request_id, "payload": chunk
+            })
+    except Exception as e:
+        logger.error("Error streaming answer: %r", e)
+        await registry.send_to_session(session_id, {
+            "type": "chat-error", "requestId": request_id, "payload": UNAVAILABLE_MESSAGE
+        })
+        return None
+    return reply
+
 
 @app.get("/api/ask-agent/{prompt}")
 async def ask_agent_endpoint(prompt: str, request: Request):
-    # Check if form data is provided in query parameters
-    form_data_param = request.query_params.get('formData')
-    current_form_state = {}
-    if form_data_param:
-        try:
-            current_form_state = json.loads(unquote(form_data_param))
-            print(f"Received form state: {current_form_state}")
-        except Exception as e:
-            print(f"Error parsing form data: {e}")
-
-    # Always include form state in the prompt context if available
-    if current_form_state and any(current_form_state.values()):
-        context_prompt = f"User asks: '{prompt}'. Current form state: {json.dumps(current_form_state)}. Respond considering what's already filled out."
+    session_id = require_session_id(request.query_params.get('sessionId'))
+
+    # The form lives on the server (patched through /api/update-form-field);
+    # the prompt only carries fields changed since the model last saw them
+    # and the ones related to the question
+    form = (await get_session_async(session_id)).form
+    form_context, form_changes = form.prompt_context(prompt)
+    if form.values or form_changes:
+        context_prompt = f"User asks: '{prompt}'. {form_context} Respond considering what's already filled out."
     else:
         context_prompt = prompt
-
-    answer = ask_agent(context_prompt, session_id=agent_session_id)
-
-    # Check if the AI response contains proactive form updates
-    changed = None
-    clean_answer = answer  # Start with the original answer
-
-    if isinstance(answer, str) and "Form Update Available:" in answer:
-        try:
-            # Extract JSON from the response
-            json_match = re.search(r'```json\s*(\{[^`]+\})\s*```', answer)
-            if json_match:
-                json_str = json_match.group(1)
-                changed = json.loads(json_str)
-                print(f"Proactive form update found: {changed}")
-                # Remove the form update section from the visible response
-                clean_answer = re.sub(r'\s*Form Update Available:\s*```json\s*\{[^`]+\}\s*```', '', answer)
-                clean_answer = clean_answer.strip()
-            else:
-                print("Form update marker found but no valid JSON extracted")
-        except Exception as e:
-            print(f"Error parsing proactive form update: {e}")
-
-    # Debug logging
-    print(f"Changed value: {changed}")
-    print(f"Changed type: {type(changed)}")
-    print(f"Connected clients: {len(connected_clients)}")
-
-    # Send WebSocket message if changed has a value
-    if changed and str(changed).strip() != "{}":
-        print(f"Sending WebSocket message for: {changed}")
-        message_data = {
-            "type": "update-form",
-            "payload": changed
-        }
-        message_json = json.dumps(message_data)
-        print(f"WebSocket message: {message_json}")
-        for client in connected_clients[:]:
-            try:
-                await client.send_text(message_json)
-                print(f"✅ Message sent to client")
-            except Exception as e:
-                print(f"❌ Failed to send message to client: {e}")
-                connected_clients.remove(client)
+    # The changes are not resent, so they stay in the conversation history
+    memory_text = f"{prompt}\n[Form changes: {minify_json(form_changes)}]" if form_changes else prompt
+
+    # With a requestId and an open socket (on any worker, with a shared
+    # backend) the answer is streamed over /ws as it is generated; the HTTP
+    # response still carries the complete answer.
+    request_id = request.query_params.get('requestId')
+    streaming = bool(request_id) and registry.reachable(session_id)
+
+    # The question picks the schema sections detailed in the prompt
+    if streaming:
+        reply = await stream_answer(context_prompt, session_id, memory_text, request_id, schema_query=prompt)
     else:
-        print(f"No WebSocket message sent. Changed: {changed}")
-
-    return {"answer": clean_answer}
-
-def has_meaningful_form_content(form_data):
-    """Check if form data contains meaningful content beyond empty fields"""
-    # Handle None/null
-    if form_data is None:
-        return False
-    
-    # Handle strings - meaningful if not empty after stripping
-    if isinstance(form_data, str):
-        return len(form_data.strip()) > 0
-    
-    # Handle numbers - meaningful if not 0 (though 0 could be meaningful in some contexts)
-    if isinstance(form_data, (int, float)):
-        return form_data != 0
-    
-    # Handle booleans - meaningful if True (False is typically default)
-    if isinstance(form_data, bool):
-        return form_data is True
-    
-    # Handle lists/arrays - meaningful if not empty and contains meaningful values
-    if isinstance(form_data, list):
-        return len(form_data) > 0 and any(has_meaningful_form_content(item) for item in form_data)
-    
-    # Handle dictionaries/objects - meaningful if any property has meaningful value
-    if isinstance(form_data, dict):
-        return any(has_meaningful_form_content(prop) for prop in form_data.values())
-    
-    # For any other type, consider it meaningful if it exists
-    return True
+        reply = await ask_agent_reply_async(context_prompt, session_id=session_id, memory_text=memory_text,
+                                            schema_query=prompt)
+    if reply is None:
+        require_answer(None)
+
+    # Fields the model filled in are part of the server-side form too; the
+    # client gets the new version with the updates
+    updates = {update["name"]: update["value"] for update in reply.form_updates}
+
+    def record_form(session):
+        session.form.mark_sent(form_changes)
+        if updates:
+            session.form.apply(updates)
+            session.form.mark_sent(updates)
+
+    session = await update_session_async(session_id, record_form)
+
+    # Form updates come from the model's tool calls, already validated against
+    # the schema; invalid ones are dropped rather than sent to the form
+    for args, error in reply.rejected:
+        logger.warning("Rejected form update %s: %s", args, error)
+    FORM_UPDATES.inc(len(reply.form_updates), outcome="applied")
+    FORM_UPDATES.inc(len(reply.rejected), outcome="rejected")
+    logger.debug("Form updates: %s", reply.form_updates)
+
+    # A streamed answer ends with a message to its own session carrying the
+    # form updates; otherwise each update is sent as before
+    if streaming:
+        await registry.send_to_session(session_id, {
+            "type": "chat-done",
+            "requestId": request_id,
+            "payload": {"answer": reply.answer, "formUpdates": reply.form_updates,
+                        "formVersion": session.form.version}
+        })
+    else:
+        # Only the requesting session's sockets get the update; queued, not awaited per socket
+        for update in reply.form_updates:
+            await registry.send_to_session(session_id, {
+                "type": "update-form", "payload": {**update, "formVersion": session.form.version}
+            })
+
+    return {"answer": reply.answer, "formVersion": session.form.version}
+
+async def start_agent_body(request):
+    """The optional start-agent JSON body: {"sessionId"?: str, "formData"?: object}."""
+    if not await request.body():
+        return {}
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body must be valid JSON")
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="Request body must be a JSON object")
+    if not isinstance(body.get("sessionId") or "", str):
+        raise HTTPException(status_code=400, detail="sessionId must be a string")
+    if not isinstance(body.get("formData") or {}, dict):
+        raise HTTPException(status_code=400, detail="formData must be an object")
+    return body
+
+
+@app.api_route("/api/start-agent", methods=["GET", "POST"])
+async def start_agent(request: Request):
+    # A POST body may carry the client's current form (e.g. a loaded draft)
+    body = await start_agent_body(request) if request.method == "POST" else {}
+    # Resume the client's session if it sent one, otherwise issue a new one
+    session_id = body.get('sessionId') or request.query_params.get('sessionId') or new_session_id()
+    logger.info("Starting agent with session ID: %s", session_id)
+
+    if "formData" in body:
+        # The client's form replaces whatever the server had for the session
+        session = await update_session_async(session_id,
+                                             lambda session: session.form.apply(body["formData"], replace=True))
+        logger.debug("Initial form state: %s", session.form.values)
+    else:
+        session = await get_session_async(session_id)
 
-@app.get("/api/start-agent")
-def start_agent(request: Request):
-    print(f"Starting agent with session ID: {agent_session_id}")
-    
-    # Check if form data is provided in query parameters
-    form_data_param = request.query_params.get('formData')
-    current_form_state = {}
-    if form_data_param:
-        try:
-            current_form_state = json.loads(unquote(form_data_param))
-            print(f"Initial form state: {current_form_state}")
-        except Exception as e:
-            print(f"Error parsing form data: {e}")
-    
     # Determine if this is asking for assistance based on meaningful content
-    has_meaningful_content = has_meaningful_form_content(current_form_state)
+    has_meaningful_content = session.form.has_content
     is_asking_for_assistance = not has_meaningful_content  # Ask for assistance if no meaningful content
     
     # Include form state in the welcome context
     if has_meaningful_content:
-        # User has existing meaningful form data (real draft/loaded submission)
-        context_prompt = f"Give a brief welcome back message. User has loaded existing form data: {json.dumps(current_form_state)}. Simply acknowledge the loaded data and mention you're ready to help. Keep it under 2 sentences. Do not ask for assistance preference."
+        # User has existing meaningful form data (real draft/loaded submission); the
+        # values themselves go to the model with the first question
+        sections = sorted({path.split(".", 1)[0] for path in session.form.values})
+        context_prompt = f"Give a brief welcome back message. User has loaded existing form data ({len(session.form.values)} fields filled in: {', '.join(sections)}). Simply acknowledge the loaded data and mention you're ready to help. Keep it under 2 sentences. Do not ask for assistance preference."
     else:
         # Fresh start or empty draft - ask for assistance
         context_prompt = "Give a brief welcome to the customer onboarding process. Ask if they would like assistance with the process. Let the user know they can ask questions in the chat at any time, regardless of their choice. Keep it concise and under 3 sentences."
     
-    answer = ask_agent(context_prompt, session_id=agent_session_id)
+    memory_text = "(Session started with existing form data)" if has_meaningful_content else "(Session started)"
+    answer = await ask_agent_async(context_prompt, session_id=session_id, memory_text=memory_text, fast=True)
+    if answer is None:
+        answer = FALLBACK_WELCOME_BACK if has_meaningful_content else FALLBACK_WELCOME
     return {
         "answer": answer,
-        "showAssistanceButtons": is_asking_for_assistance
+        "showAssistanceButtons": is_asking_for_assistance,
+        "sessionId": session_id,
+        "formVersion": session.form.version
     }
 
 
+async def apply_form_patch(session_id, patch, base_version=None, replace=False):
+    """Apply a patch to the session's form and save it; a stale base version is a 409."""
+    try:
+        session = await update_session_async(
+            session_id, lambda session: session.form.apply(patch, base_version=base_version, replace=replace))
+    except FormVersionConflict as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "formVersion": e.version})
+    logger.debug("Form data updated to version %d: %s", session.form.version, session.form.values)
+    return session
+
+
 @app.post("/api/update-form-field")
 async def update_form_field(field_data: dict):
-    # Update form data
-    form_data[field_data["name"]] = field_data["value"]
-    print(f"Form data updated: {form_data}")
-
-    # Get complete form state if provided
-    complete_form_data = field_data.get("completeFormData", {})
-    
-    # Include complete form state in the prompt context
-    if complete_form_data and any(complete_form_data.values()):
-        context_prompt = f"User updated '{field_data['name']}' to '{field_data['value']}'. Current complete form state: {json.dumps(complete_form_data)}. Give brief confirmation, then ask for the next UNFILLED field. Keep under 2 sentences."
-    else:
-        context_prompt = f"User updated '{field_data['name']}' to '{field_data['value']}'. Give brief confirmation, then ask for the next field. Keep under 2 sentences."
-    
-    answer = ask_agent(context_prompt, session_id=agent_session_id)
-    return {"answer": answer}
+    session_id = require_session_id(field_data.get("sessionId"))
+
+    # A patch syncs the form without a chat turn: {path: value} changed since
+    # baseVersion, or the whole form with replace
+    if "patch" in field_data:
+        session = await apply_form_patch(session_id, field_data["patch"], field_data.get("baseVersion"),
+                                         field_data.get("replace", False))
+        return {"formVersion": session.form.version}
+
+    # A single field the user finished editing, which gets a confirmation
+    session = await apply_form_patch(session_id, {field_data["name"]: field_data["value"]},
+                                     field_data.get("baseVersion"))
+    version = session.form.version
+
+    # Schema fields are confirmed from a template; only unknown ones need the LLM
+    memory_text = f"(Updated field '{field_data['name']}')"
+    answer = get_field_updated_message(field_data["name"], field_data["value"])
+    if answer is not None:
+        await remember_turn_async(session_id, memory_text, answer)
+        return {"answer": answer, "formVersion": version}
+
+    # Only the fields changed since the last prompt and the ones in the
+    # updated field's section go to the model
+    form_context, form_changes = session.form.prompt_context(field_data["name"])
+    context_prompt = f"User updated '{field_data['name']}' to '{field_data['value']}'. {form_context} Give brief confirmation, then ask for the next UNFILLED field. Keep under 2 sentences."
+    if form_changes:
+        memory_text += f"\n[Form changes: {minify_json(form_changes)}]"
+
+    answer = await ask_agent_async(context_prompt, session_id=session_id, memory_text=memory_text,
+                                   schema_query=field_data["name"], fast=True)
+    require_answer(answer)
+    await update_session_async(session_id, lambda session: session.form.mark_sent(form_changes))
+    return {"answer": answer, "formVersion": version}
 
 
 @app.post("/api/toggle-smart-guide")
 async def toggle_smart_guide(toggle_data: dict):
+    session_id = require_session_id(toggle_data.get("sessionId"))
     enabled = toggle_data.get("enabled", True)
-    form_data_provided = toggle_data.get("formData", {})
-    print(f"Smart Guide toggled: {enabled}")
-    print(f"Form data provided: {form_data_provided}")
+    logger.info("Smart Guide toggled: %s", enabled)
     
     if enabled:
         context_prompt = "Great! Start filling out the form and I'll assist you along the way. Click on any field for context and requirements."
-        answer = ask_agent(context_prompt, session_id=agent_session_id)
+        answer = await ask_agent_async(context_prompt, session_id=session_id, fast=True)
     else:
-        answer = ask_agent("Briefly confirm Manual mode is active. Keep it under 1 sentence.", session_id=agent_session_id)
+        answer = await ask_agent_async("Briefly confirm Manual mode is active. Keep it under 1 sentence.",
+                                       session_id=session_id, fast=True)
     
-    return {"answer": answer}
+    return {"answer": require_answer(answer)}
 
 
 @app.post("/api/get-field-context")
 async def get_field_context(request: Request):
     data = await request.json()
+    session_id = require_session_id(data.get('sessionId'))
     field_name = data.get('name', '')
     field_label = data.get('value', '')  # Using value field to pass the field label
 
-    # Only include field name/label in the prompt, not the full form state
-    context_prompt = f"""
-FIELD CONTEXT REQUEST:
-The user is focusing on the field: \"{field_label}\" (path: {field_name})
-
-Provide helpful context about the \"{field_label}\" field. Explain what it's for, mention any requirements, and give examples if helpful. Be specific and mention the field name explicitly instead of saying \"This field\". Keep it natural and under 2 sentences.
-"""
-    
-    answer = ask_agent(context_prompt, session_id=agent_session_id)
+    # Field context does not depend on the conversation, so it is answered
+    # statelessly (and cached) and only recorded in this session's history
+    answer = require_answer(await get_field_context_async(field_name, field_label))
+    await remember_turn_async(session_id, f"(Focused field '{field_label}' at {field_name})", answer)
     return {"answer": answer}
 
 
@@ -227,19 +371,38 @@ Provide helpful context about the \"{field_label}\" field. Explain what it's for
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    connected_clients.append(websocket)
+    # Clients join their session to receive its form updates and streamed answers
+    session_id = websocket.query_params.get("sessionId", "")
+    connection = registry.register(websocket, session_id)
     try:
         while True:
+            # Any message (normally a pong) shows the client is alive
             await websocket.receive_text()
+            registry.touch(connection)
     except:
-        if websocket in connected_clients:
-            connected_clients.remove(websocket)
+        registry.unregister(connection)
+
+
+@app.get("/api/stats")
+async def stats():
+    content = get_content()
+    return {"websockets": registry.stats(),
+            "content": {"version": content.version, "loadedAt": content.loaded_at}}
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Process metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 
 
 # Mount static files
 # Temporarily serve Vue app until Angular is built for production
-app.mount("/", StaticFiles(directory="angular-client/dist/customer-onboarding-angular", html=True), name="static")
+# Skipped when the client has not been built (dev server on :4200, benchmarks)
+STATIC_DIR = "angular-client/dist/customer-onboarding-angular"
+if os.path.isdir(STATIC_DIR):
+    app.mount("/", StaticFiles(directory=STATIC_DIR, html=True), name="static")
 # For production Angular build, use: angular-client/dist/customer-onboarding-angular
 
 # Add server startup code
@@ -0,0 +1,166 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) for latency histograms: fast template answers up to
+# slow LLM calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Upper bounds (estimated tokens) for prompt and history size histograms
+TOKEN_BUCKETS = (100, 250, 500, 1000, 1500, 2000, 3000, 5000, 8000, 12000)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base for metrics with a fixed set of label names.
+
+    Updates only take a lock and touch a dict, so they are cheap enough for
+    the request path; formatting happens when /metrics is scraped. Values
+    kept elsewhere (e.g. cache counters) can instead be read at scrape time
+    by a `callback` returning a number or a {label values tuple: number} dict.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name, help_text, labels=(), callback=None):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def samples(self):
+        """Yield (suffix, label values, extra labels, value) for exposition."""
+        if self.callback is not None:
+            values = self.callback()
+            items = values.items() if isinstance(values, dict) else [((), values)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        for key, value in items:
+            yield "", key, (), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labels, key, extra)} {_format_number(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += 1
+            entry[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the block takes, whether or not it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), count, total)) for key, (counts, count, total) in self._values.items()]
+        for key, (counts, count, total) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield "_bucket", key, (("le", _format_number(float(bound))),), cumulative
+            yield "_bucket", key, (("le", "+Inf"),), count
+            yield "_sum", key, (), total
+            yield "_count", key, (), count
+
+
+class MetricsRegistry:
+    """Metrics of this process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        # A module imported twice (e.g. main.py run as a script, then loaded
+        # by uvicorn as main:app) gets the already registered instance
+        return self._metrics.setdefault(metric.name, metric)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _register(metric, callback):
+    metric = REGISTRY.register(metric)
+    if callback is not None:
+        metric.callback = callback
+    return metric
+
+
+def counter(name, help_text, labels=(), callback=None):
+    return _register(Counter(name, help_text, labels), callback)
+
+
+def gauge(name, help_text, labels=(), callback=None):
+    return _register(Gauge(name, help_text, labels), callback)
+
+
+def histogram(name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, help_text, labels, buckets))
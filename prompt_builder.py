@@ -0,0 +1,168 @@
+import json
+import math
+import re
+from datetime import datetime
+
+from jinja2 import BaseLoader, Environment
+
+# full:      the pretty-printed schema, as SYSTEM_PROMPT.md always had it
+# compact:   the same schema as minified JSON
+# selective: a minified outline of every field in the static prefix, plus full
+#            details only for the sections relevant to each request
+PROMPT_MODES = ("full", "compact", "selective")
+
+OUTLINE_NOTE = """
+The schema above is an outline: each field maps to its type or allowed values, and `*` marks required fields. \
+Descriptions, requirements, examples and validation rules for the sections relevant to a request are provided \
+with that request."""
+
+_CAMEL = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_WORD = re.compile(r"[a-z0-9]{3,}")
+
+
+def minify_json(data):
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def schema_outline(node):
+    """Field name -> type or allowed values, nested like the schema."""
+    outline = {}
+    required = set(node.get("required", []))
+    for name, prop in node.get("properties", {}).items():
+        key = name + ("*" if name in required else "")
+        if prop.get("type") == "object":
+            outline[key] = schema_outline(prop)
+        elif prop.get("enum"):
+            outline[key] = prop["enum"]
+        elif prop.get("type") == "array":
+            items = prop.get("items", {})
+            outline[key] = [items.get("enum") or items.get("type", "string")]
+        else:
+            outline[key] = prop.get("type", "string") + (f":{prop['format']}" if prop.get("format") else "")
+    return outline
+
+
+def words(text):
+    """Lowercase words of 3+ characters, with camelCase identifiers split."""
+    return _WORD.findall(_CAMEL.sub(" ", text).lower())
+
+
+def idf_weights(documents):
+    """Inverse document frequency of each word over {name: word set}."""
+    doc_freq = {}
+    for document_words in documents.values():
+        for word in document_words:
+            doc_freq[word] = doc_freq.get(word, 0) + 1
+    # Words found in every document (e.g. "file", "transfer") weigh nothing
+    return {word: math.log(len(documents) / df) for word, df in doc_freq.items()}
+
+
+def best_matches(query_words, documents, idf, limit):
+    """Names of up to `limit` documents sharing the most informative words with a query."""
+    scores = []
+    for name, document_words in documents.items():
+        score = sum(idf[word] for word in query_words & document_words)
+        if score > 0:
+            scores.append((score, name))
+    scores.sort(reverse=True)
+    return [name for _, name in scores[:limit]]
+
+
+def content_text(content):
+    """Plain text of message content, whether a string or a list of blocks."""
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in content)
+
+
+class PromptBuilder:
+    """Builds the system message from SYSTEM_PROMPT.md, the questions schema and KNOWLEDGEBASE.md.
+
+    The rendered template is a static prefix shared by every request. In
+    "selective" mode the details of up to `max_sections` schema sections
+    relevant to the request (the section of a focused field, or the sections
+    whose wording best matches a question) are appended after it. The
+    knowledge base is in the prefix in "full" mode. Otherwise free-form
+    questions get the `top_k` knowledge base and field chunks that the
+    `retriever` (a retrieval.BM25Index) ranks highest instead, which are
+    much smaller than whole schema sections. The current date and time is
+    added to every request rather than rendered once. With `prompt_cache`
+    the prefix is marked for Bedrock prompt caching; the model must support
+    it (e.g. Claude 3.5 Haiku, Claude 3.7 Sonnet and later).
+    """
+
+    def __init__(self, template_text, schema_text, knowledge_base="", mode="selective", prompt_cache=False,
+                 max_sections=2, retriever=None, top_k=4):
+        if mode not in PROMPT_MODES:
+            raise ValueError(f"Unknown prompt mode '{mode}', expected one of {PROMPT_MODES}")
+        self.mode = mode
+        self.prompt_cache = prompt_cache
+        self.max_sections = max_sections
+        self.retriever = retriever
+        self.top_k = top_k
+        schema = json.loads(schema_text)
+        self.sections = schema.get("properties", {})
+
+        if mode == "full":
+            rendered_schema = schema_text
+        elif mode == "compact":
+            rendered_schema = minify_json(schema)
+        else:
+            rendered_schema = minify_json(schema_outline(schema))
+        template = Environment(loader=BaseLoader()).from_string(template_text)
+        self.static_prefix = template.render({"questions_schema": rendered_schema})
+        if mode == "selective":
+            self.static_prefix += "\n" + OUTLINE_NOTE
+        if mode == "full" and knowledge_base:
+            self.static_prefix += f"\n\nService documentation:\n\n{knowledge_base}"
+
+        # Section details and word weights for matching questions to sections
+        self._details = {name: minify_json(section) for name, section in self.sections.items()}
+        self._section_words = {name: set(words(json.dumps(section))) for name, section in self.sections.items()}
+        self._idf = idf_weights(self._section_words)
+
+    def select_sections(self, query):
+        """Names of the schema sections relevant to a field path or question."""
+        if self.mode != "selective" or not query:
+            return []
+        head = query.split(".", 1)[0]
+        if head in self.sections:
+            return [head]
+        if self.retriever is not None:
+            return []
+        return best_matches(set(words(query)), self._section_words, self._idf, self.max_sections)
+
+    def select_knowledge(self, query):
+        """Texts of the knowledge chunks relevant to a free-form question.
+
+        Field paths get none; their schema section is detailed instead.
+        """
+        if self.mode == "full" or self.retriever is None or not query or query.split(".", 1)[0] in self.sections:
+            return []
+        # Compact mode has every field's details in the prefix already
+        kinds = ("knowledge",) if self.mode == "compact" else None
+        return [chunk["text"] for _, chunk in self.retriever.search(query, self.top_k, kinds)]
+
+    def system_content(self, query=None, extra="", now=None):
+        """System message content for one request.
+
+        Returns a plain string unless prompt caching needs the static prefix
+        as its own content block.
+        """
+        parts = [f"Current date and time: {(now or datetime.now()).strftime('%Y-%m-%d %H:%M')}"]
+        selected = self.select_sections(query)
+        if selected:
+            details = ",".join(f'"{name}":{self._details[name]}' for name in selected)
+            parts.append(f"Schema details for the sections relevant to this request:\n```json\n{{{details}}}\n```")
+        knowledge = self.select_knowledge(query)
+        if knowledge:
+            excerpts = "\n\n".join(knowledge)
+            parts.append(f"Service documentation and form fields relevant to this request:\n\n{excerpts}")
+        if extra:
+            parts.append(extra)
+        dynamic = "\n\n".join(parts)
+
+        if not self.prompt_cache:
+            return self.static_prefix + "\n\n" + dynamic
+        return [{"type": "text", "text": self.static_prefix, "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": dynamic}]
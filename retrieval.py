@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import re
+import time
+
+import numpy as np
+
+import metrics
+from field_cache import content_hash
+from prompt_builder import words
+from schema_index import render_field_context
+
+logger = logging.getLogger(__name__)
+
+# Searches take well under a millisecond, so the buckets start lower than
+# metrics.LATENCY_BUCKETS
+RETRIEVAL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+RETRIEVAL_SECONDS = metrics.histogram("retrieval_duration_seconds", "Time to rank knowledge chunks for a request",
+                                      buckets=RETRIEVAL_BUCKETS)
+RETRIEVAL_CHUNKS = metrics.counter("retrieval_chunks_total", "Chunks injected into prompts by retrieval", ["kind"])
+INDEX_BUILD_SECONDS = metrics.gauge("retrieval_index_build_seconds", "Time to build or load the retrieval index",
+                                    ["source"])
+
+# Part of the index version; bump when chunking or terms() change so saved
+# indexes are rebuilt
+INDEX_FORMAT = 1
+
+_HEADING = re.compile(r"^(#{2,3}) (.+)$", re.MULTILINE)
+
+STOPWORDS = frozenset(
+    "the and are for you your what which who how does did can could should would will with this that these "
+    "those from into about have has had was were been being not but any all our its their there here when "
+    "where why need needs want like also than then them they use used using".split()
+)
+
+
+def terms(text):
+    """Index terms: words of 3+ characters without stopwords, with plurals folded ("slas" -> "sla")."""
+    return [word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+            for word in words(text) if word not in STOPWORDS]
+
+
+def knowledge_chunks(text):
+    """One chunk per `##`/`###` section of a markdown document, titled with its heading path."""
+    chunks = []
+    matches = list(_HEADING.finditer(text))
+    parent = None
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        heading = match.group(2).strip()
+        if len(match.group(1)) == 2:
+            parent = heading
+            title = heading
+        else:
+            title = f"{parent} > {heading}" if parent else heading
+        body = text[match.end():end].strip()
+        if body:
+            chunks.append({"kind": "knowledge", "title": title, "section": None, "text": f"{title}\n{body}"})
+    return chunks
+
+
+def field_chunks(schema_index):
+    """One chunk per schema leaf: its path, section and the field help text."""
+    return [
+        {"kind": "field", "title": field.title, "section": path.split(".", 1)[0],
+         "text": f"Field '{field.title}' ({path}, section '{field.section}'): {render_field_context(field)}"}
+        for path, field in schema_index.fields.items()
+    ]
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed set of chunks, scored with NumPy.
+
+    The BM25 weight of every (chunk, term) pair is computed once when the
+    index is built, so a search is a column gather and a row sum over a
+    dense chunks x vocabulary matrix (a few hundred chunks here).
+    """
+
+    def __init__(self, chunks, weights, vocabulary, version=None):
+        self.chunks = chunks
+        self.weights = weights
+        self.vocabulary = vocabulary
+        self.version = version
+
+    @classmethod
+    def build(cls, chunks, k1=1.5, b=0.75, version=None):
+        docs = [terms(chunk["text"]) for chunk in chunks]
+        vocabulary = {}
+        for doc in docs:
+            for word in doc:
+                vocabulary.setdefault(word, len(vocabulary))
+        tf = np.zeros((len(docs), len(vocabulary)), dtype=np.float32)
+        for row, doc in enumerate(docs):
+            np.add.at(tf[row], [vocabulary[word] for word in doc], 1)
+        lengths = tf.sum(axis=1, keepdims=True)
+        doc_freq = (tf > 0).sum(axis=0)
+        idf = np.log(1 + (len(docs) - doc_freq + 0.5) / (doc_freq + 0.5))
+        norm = k1 * (1 - b + b * lengths / max(float(lengths.mean()), 1.0))
+        weights = (idf * tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+        return cls(chunks, weights, vocabulary, version)
+
+    def search(self, query, k=4, kinds=None):
+        """Up to `k` (score, chunk) pairs best matching a query, best first."""
+        with RETRIEVAL_SECONDS.time():
+            columns = [self.vocabulary[term] for term in terms(query) if term in self.vocabulary]
+            if not columns or not self.chunks:
+                return []
+            scores = self.weights[:, columns].sum(axis=1)
+            results = []
+            for row in np.argsort(-scores):
+                chunk = self.chunks[row]
+                if scores[row] <= 0 or len(results) == k:
+                    break
+                if kinds and chunk["kind"] not in kinds:
+                    continue
+                results.append((float(scores[row]), chunk))
+        for _, chunk in results:
+            RETRIEVAL_CHUNKS.inc(kind=chunk["kind"])
+        return results
+
+    def save(self, path):
+        # Write to a temporary file first so other workers never read half a file
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, weights=self.weights, meta=np.array(json.dumps(
+                {"version": self.version, "vocabulary": self.vocabulary, "chunks": self.chunks})))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(meta["chunks"], data["weights"], meta["vocabulary"], meta["version"])
+
+
+def load_or_build(knowledge_base, schema_text, schema_index, path=None):
+    """The index for this knowledge base and schema, reusing the file at `path` if it matches."""
+    start = time.perf_counter()
+    version = f"{INDEX_FORMAT}:{content_hash(knowledge_base + chr(0) + schema_text)}"
+    if path and os.path.exists(path):
+        try:
+            index = BM25Index.load(path)
+            if index.version == version:
+                INDEX_BUILD_SECONDS.set(time.perf_counter() - start, source="disk")
+                return index
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Rebuilding retrieval index, could not load %s: %r", path, e)
+    index = BM25Index.build(knowledge_chunks(knowledge_base) + field_chunks(schema_index), version=version)
+    INDEX_BUILD_SECONDS.set(time.perf_counter() - start, source="build")
+    if path:
+        try:
+            index.save(path)
+        except OSError as e:
+            logger.warning("Could not save retrieval index to %s: %r", path, e)
+    logger.info("Built retrieval index: %d chunks, %d terms", len(index.chunks), len(index.vocabulary))
+    return index
@@ -0,0 +1,183 @@
+import json
+import re
+from datetime import date
+
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_TRUE = {"true", "yes", "y"}
+_FALSE = {"false", "no", "n"}
+
+
+def compile_validator(prop):
+    """Build a function that checks a value for one schema leaf and normalizes it.
+
+    Runs once per field when the index is built, so validating a value later
+    is a few type checks. The function raises ValueError for invalid values.
+    """
+    kind = prop.get("type", "string")
+    enum = prop.get("enum") or prop.get("items", {}).get("enum") or []
+    # Model output is matched to the allowed values case-insensitively
+    choices = {str(option).lower(): option for option in enum}
+    pattern = re.compile(prop["pattern"]) if prop.get("pattern") else None
+    is_date = prop.get("format") == "date"
+
+    def choice(value):
+        option = choices.get(str(value).strip().lower())
+        if option is None:
+            raise ValueError(f"expected one of {enum}, got {value!r}")
+        return option
+
+    def validate_boolean(value):
+        if isinstance(value, bool):
+            return value
+        text = str(value).strip().lower()
+        if text in _TRUE or text in _FALSE:
+            return text in _TRUE
+        raise ValueError(f"expected true or false, got {value!r}")
+
+    def validate_array(value):
+        items = value.split(",") if isinstance(value, str) else value
+        if not isinstance(items, list):
+            raise ValueError(f"expected a list, got {value!r}")
+        items = [choice(item) if choices else str(item).strip() for item in items if str(item).strip()]
+        return list(dict.fromkeys(items))
+
+    def validate_string(value):
+        if isinstance(value, (dict, list, bool)) or value is None:
+            raise ValueError(f"expected text, got {value!r}")
+        text = str(value).strip()
+        if not text:
+            return text
+        if choices:
+            return choice(text)
+        if is_date:
+            try:
+                if not _DATE.fullmatch(text):
+                    raise ValueError
+                date.fromisoformat(text)
+            except ValueError:
+                raise ValueError(f"expected a YYYY-MM-DD date, got {value!r}") from None
+        if pattern is not None and not pattern.fullmatch(text):
+            raise ValueError(f"does not match {pattern.pattern}")
+        return text
+
+    return {"boolean": validate_boolean, "array": validate_array}.get(kind, validate_string)
+
+
+class FieldInfo:
+    """Metadata for one leaf field of questions_schema.json."""
+
+    def __init__(self, path, prop, section=None, required=False):
+        self.path = path
+        self.title = prop.get("title", path.rsplit(".", 1)[-1])
+        self.type = prop.get("type", "string")
+        self.description = prop.get("description", "")
+        self.requirements = prop.get("requirements", "")
+        self.examples = prop.get("examples", [])
+        self.validation = prop.get("validation", "")
+        self.format = prop.get("format")
+        # Allowed values, for enums and arrays of enums
+        self.enum = prop.get("enum") or prop.get("items", {}).get("enum") or []
+        self.section = section
+        self.required = required
+        self.validate = compile_validator(prop)
+
+
+class SchemaIndex:
+    """Dotted field path -> FieldInfo for every leaf of the questions schema.
+
+    Paths match the ones the Angular client sends (e.g.
+    `networkCloudInfo.cloudDetails.awsAccountNumber`); numeric segments from
+    form arrays are ignored when looking fields up.
+    """
+
+    def __init__(self, schema):
+        self.fields = {}
+        self._walk(schema, "", None)
+
+    @classmethod
+    def from_json(cls, text):
+        return cls(json.loads(text))
+
+    def _walk(self, node, prefix, section):
+        required = set(node.get("required", []))
+        for name, prop in node.get("properties", {}).items():
+            path = f"{prefix}.{name}" if prefix else name
+            if prop.get("type") == "object":
+                # Top-level objects are the form sections
+                self._walk(prop, path, section or prop.get("title"))
+            else:
+                self.fields[path] = FieldInfo(path, prop, section, name in required)
+
+    def get(self, path):
+        """Look up a field, or None if the path is not a schema leaf."""
+        field = self.fields.get(path)
+        if field is None and path:
+            field = self.fields.get(".".join(p for p in path.split(".") if not p.isdigit()))
+        return field
+
+    def validate(self, path, value):
+        """Return (field, normalized value), or raise ValueError if either is invalid."""
+        field = self.get(path)
+        if field is None:
+            raise ValueError(f"unknown field '{path}'")
+        return field, field.validate(value)
+
+    def leaves(self):
+        """Yield (path, title) for every leaf field."""
+        for path, field in self.fields.items():
+            yield path, field.title
+
+    def __contains__(self, path):
+        return self.get(path) is not None
+
+    def __len__(self):
+        return len(self.fields)
+
+
+def _sentence(text):
+    text = text.strip()
+    return text if not text or text.endswith((".", "!", "?")) else text + "."
+
+
+def format_value(field, value):
+    """Human-readable rendering of a form value for confirmations."""
+    if isinstance(value, bool) or field is not None and field.type == "boolean":
+        return "Yes" if value else "No"
+    if isinstance(value, list):
+        return ", ".join(str(v) for v in value) if value else "none"
+    return str(value)
+
+
+def render_field_context(field):
+    """Explain a field from its schema metadata, like the LLM would."""
+    # Question-style titles ("Is using IODS?") read better without a colon
+    separator = " " if field.title.endswith("?") else ": "
+    parts = [_sentence(f"{field.title}{separator}{field.description}" if field.description else field.title)]
+    if field.requirements:
+        parts.append(_sentence(field.requirements))
+    if field.validation:
+        parts.append(_sentence(field.validation))
+    if field.enum:
+        parts.append(f"Options: {', '.join(field.enum)}.")
+    elif field.examples:
+        parts.append(f"Examples: {', '.join(str(e) for e in field.examples[:3])}.")
+    return " ".join(parts)
+
+
+def render_field_updated(field, value):
+    """Brief confirmation that a field was set, or what is wrong with the value."""
+    if field is None:
+        return "Got it, that's saved."
+    if value is None or value == "" or value == []:
+        return f"Okay, {field.title.rstrip('?')} is now empty."
+    try:
+        value = field.validate(value)
+    except ValueError:
+        if field.enum:
+            hint = f"Options: {', '.join(field.enum)}"
+        else:
+            hint = field.validation or field.requirements or "Please check the value"
+        return f"Hmm, {format_value(field, value)} doesn't look right for {field.title.rstrip('?')}. {_sentence(hint)}"
+    if field.title.endswith("?"):
+        return f"Perfect! {field.title} {format_value(field, value)}."
+    return f"Perfect! {field.title} is set to {format_value(field, value)}."
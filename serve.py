@@ -0,0 +1,43 @@
+"""Production entrypoint: several uvicorn workers, no auto-reload.
+
+    python serve.py                       # WEB_WORKERS (default: CPU count)
+    STATE_BACKEND=sqlite python serve.py --workers 4
+
+Each worker is a separate process with its own event loop, so session state
+and WebSocket messages must go through a shared backend (STATE_BACKEND=sqlite
+on one host, redis across hosts); with STATE_BACKEND=memory only one worker
+is started. `python main.py` remains the development server with reload.
+"""
+import argparse
+import logging
+import os
+
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the onboarding API with several workers")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    args = parser.parse_args()
+
+    workers = max(1, args.workers)
+    if workers > 1 and os.getenv("STATE_BACKEND", "memory") == "memory":
+        logging.basicConfig()
+        logger.warning("STATE_BACKEND=memory keeps sessions in one process; starting 1 worker instead of %d "
+                       "(set STATE_BACKEND=sqlite or redis to use more)", workers)
+        workers = 1
+
+    print(f"Starting FastAPI server on http://{args.host}:{args.port} with {workers} worker(s)")
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=workers, reload=False,
+                log_level=os.getenv("LOG_LEVEL", "info").lower())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from conversation_memory import ConversationMemory
+from form_state import FormState
+
+
+class SessionConflictError(RuntimeError):
+    """A session kept changing on other workers while an update was retried."""
+
+
+def new_session_id():
+    """Generate a new, unguessable session ID."""
+    return uuid.uuid4().hex
+
+
+class Session:
+    """Per-client state: conversation memory and the form (a FormState)."""
+
+    def __init__(self, session_id, memory, form=None, version=0, content_version=None):
+        self.session_id = session_id
+        self.memory = memory
+        self.form = form if form is not None else FormState()
+        # Version of the record in the shared backend this copy reflects
+        self.version = version
+        # Prompt content version (see content_loader) of the last request
+        self.content_version = content_version
+        self.last_access = time.monotonic()
+
+    def to_record(self):
+        return json.dumps({"memory": self.memory.to_dict(), "form": self.form.to_dict(),
+                           "content_version": self.content_version})
+
+
+class SQLiteSessionBackend:
+    """Session records in a SQLite file shared by all workers on one host.
+
+    Every save bumps the record's version, so workers can tell whether their
+    cached copy of a session is current with one indexed lookup, and a save
+    only succeeds if the record is still at the version the copy was loaded
+    from. Expired records are purged at most every `purge_interval` seconds.
+    """
+
+    def __init__(self, path, ttl_seconds=7 * 24 * 3600, purge_interval=300.0):
+        self.ttl_seconds = ttl_seconds
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._lock = threading.Lock()
+        with self._lock:
+            # WAL lets readers in other processes work while one writes
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS session_state ("
+                "session_id TEXT PRIMARY KEY, record TEXT NOT NULL, version INTEGER NOT NULL, "
+                "updated_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def version(self, session_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT version FROM session_state WHERE session_id = ? AND updated_at >= ?",
+                (session_id, time.time() - self.ttl_seconds),
+            ).fetchone()
+        return row[0] if row else None
+
+    def load(self, session_id):
+        """Return (version, record) or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT version, record FROM session_state WHERE session_id = ? AND updated_at >= ?",
+                (session_id, time.time() - self.ttl_seconds),
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def save(self, session_id, record, expected_version):
+        """Store a record if the stored one is still at `expected_version` (0: none).
+
+        Returns the new version, or None if another worker saved in between.
+        """
+        now = time.time()
+        cutoff = now - self.ttl_seconds
+        with self._lock:
+            if expected_version:
+                row = self._db.execute(
+                    "UPDATE session_state SET record = ?, version = version + 1, updated_at = ? "
+                    "WHERE session_id = ? AND version = ? AND updated_at >= ? RETURNING version",
+                    (record, now, session_id, expected_version, cutoff),
+                ).fetchone()
+            else:
+                # An expired record counts as none
+                row = self._db.execute(
+                    "INSERT INTO session_state (session_id, record, version, updated_at) VALUES (?, ?, 1, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET record = excluded.record, version = version + 1, "
+                    "updated_at = excluded.updated_at WHERE session_state.updated_at < ? RETURNING version",
+                    (session_id, record, now, cutoff),
+                ).fetchone()
+            if now - self._last_purge >= self.purge_interval:
+                self._last_purge = now
+                self._db.execute("DELETE FROM session_state WHERE updated_at < ?", (cutoff,))
+            self._db.commit()
+        return row[0] if row else None
+
+    def delete(self, session_id):
+        with self._lock:
+            self._db.execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+            self._db.commit()
+
+
+class RedisSessionBackend:
+    """Session records in Redis (or a Redis-compatible server), shared by every node.
+
+    Needs the optional `redis` package. Records expire after `ttl_seconds`
+    without a save. Saves are compare-and-set on the version (WATCH/MULTI).
+    """
+
+    def __init__(self, url, ttl_seconds=7 * 24 * 3600, prefix="onboarding:session:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("STATE_BACKEND=redis needs the redis package: pip install redis") from None
+        self._redis = redis.Redis.from_url(url)
+        self._watch_error = redis.WatchError
+        self.ttl_seconds = int(ttl_seconds)
+        self.prefix = prefix
+
+    def version(self, session_id):
+        version = self._redis.hget(self.prefix + session_id, "version")
+        return int(version) if version is not None else None
+
+    def load(self, session_id):
+        version, record = self._redis.hmget(self.prefix + session_id, "version", "record")
+        if version is None or record is None:
+            return None
+        return int(version), record.decode("utf-8")
+
+    def save(self, session_id, record, expected_version):
+        """Like SQLiteSessionBackend.save."""
+        key = self.prefix + session_id
+        with self._redis.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                current = pipe.hget(key, "version")
+                if (int(current) if current is not None else 0) != expected_version:
+                    return None
+                pipe.multi()
+                pipe.hset(key, mapping={"version": expected_version + 1, "record": record})
+                pipe.expire(key, self.ttl_seconds)
+                pipe.execute()
+            except self._watch_error:
+                return None
+        return expected_version + 1
+
+    def delete(self, session_id):
+        self._redis.delete(self.prefix + session_id)
+
+
+class SessionStore:
+    """LRU/TTL-bounded session store with optional spill to SQLite.
+
+    At most `max_sessions` sessions are kept in RAM. Sessions idle for longer
+    than `ttl_seconds`, or pushed out by the LRU cap, are written to the
+    SQLite file at `spill_path` (when set) and loaded back on next access;
+    without a spill path they are dropped. Spilled sessions are purged after
+    `disk_ttl_seconds`. New sessions get memory from `memory_factory`.
+
+    With a shared `backend` (SQLiteSessionBackend, RedisSessionBackend) the
+    backend is the source of truth and RAM only caches it: get() reloads a
+    session another worker has saved since, and changes go through update(),
+    which saves only if nobody else saved the session in between and
+    otherwise reloads it and applies the change again, so concurrent changes
+    on two workers are never lost. The async variants run backend I/O in a
+    thread so the event loop is not blocked.
+    """
+
+    def __init__(self, max_sessions=500, ttl_seconds=1800, spill_path=None,
+                 disk_ttl_seconds=7 * 24 * 3600, memory_factory=ConversationMemory, backend=None):
+        self.memory_factory = memory_factory
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.disk_ttl_seconds = disk_ttl_seconds
+        self.backend = backend
+        self._sessions = OrderedDict()
+        self._lock = threading.RLock()
+        self._db = None
+        self.evictions = 0
+        self.spill_loads = 0
+        self.shared_loads = 0
+        self.conflicts = 0
+        # Serializes updates to one session within this process
+        self._update_locks = {}
+        # A shared backend already keeps every session, so nothing is spilled
+        if spill_path and backend is None:
+            self._db = sqlite3.connect(spill_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, record TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, session_id):
+        """Get a session, restoring it from disk or creating it if needed."""
+        with self._lock:
+            self._expire_idle()
+            session = self._sessions.get(session_id)
+            if self.backend is not None:
+                session = self._load_shared(session_id, session)
+            elif session is None:
+                session = self._load_spilled(session_id)
+            if session is None:
+                session = Session(session_id, self.memory_factory())
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            self._enforce_cap()
+            session.last_access = time.monotonic()
+            return session
+
+    @property
+    def _does_io(self):
+        """Whether get() may read or write a shared backend or the spill file."""
+        return self.backend is not None or self._db is not None
+
+    async def get_async(self, session_id):
+        """Like get(), without blocking the event loop on the shared backend or spill file."""
+        if not self._does_io:
+            return self.get(session_id)
+        return await asyncio.to_thread(self.get, session_id)
+
+    def _save(self, session):
+        """Write a changed session to the shared backend; False if another worker saved it first."""
+        if self.backend is None:
+            return True
+        version = self.backend.save(session.session_id, session.to_record(), session.version)
+        if version is None:
+            # The cached copy is stale and holds the unsaved change; reload it next time
+            with self._lock:
+                if self._sessions.get(session.session_id) is session:
+                    del self._sessions[session.session_id]
+            self.conflicts += 1
+            return False
+        session.version = version
+        return True
+
+    def update(self, session_id, change, attempts=5):
+        """Apply `change(session)` to the current session, save it and return the session.
+
+        On a conflicting save the session is reloaded and `change` applied to
+        the fresh copy, so it must only depend on its argument. Exceptions
+        from `change` propagate and nothing is saved.
+        """
+        with self._lock:
+            for _ in range(attempts):
+                session = self.get(session_id)
+                change(session)
+                if self._save(session):
+                    return session
+        raise SessionConflictError(f"Session {session_id} changed on every attempt to update it")
+
+    async def update_async(self, session_id, change, attempts=5):
+        """Like update(), without blocking the event loop on the shared backend or spill file."""
+        if not self._does_io:
+            return self.update(session_id, change)
+        async with self._update_locks.setdefault(session_id, asyncio.Lock()):
+            for _ in range(attempts):
+                session = await self.get_async(session_id)
+                change(session)
+                if self.backend is None or await asyncio.to_thread(self._save, session):
+                    return session
+        raise SessionConflictError(f"Session {session_id} changed on every attempt to update it")
+
+    def discard(self, session_id):
+        """Forget a session both in memory and on disk."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._update_locks.pop(session_id, None)
+            if self.backend is not None:
+                self.backend.delete(session_id)
+            if self._db is not None:
+                self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._db.commit()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def _expire_idle(self):
+        # Oldest entries are at the front, so stop at the first fresh one
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_access >= cutoff:
+                break
+            self._evict(session_id)
+
+    def _enforce_cap(self):
+        while len(self._sessions) > self.max_sessions:
+            self._evict(next(iter(self._sessions)))
+
+    def _evict(self, session_id):
+        session = self._sessions.pop(session_id)
+        self._update_locks.pop(session_id, None)
+        self.evictions += 1
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, record, updated_at) VALUES (?, ?, ?)",
+                (session_id, session.to_record(), time.time()),
+            )
+            self._db.execute(
+                "DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.disk_ttl_seconds,)
+            )
+            self._db.commit()
+
+    def _load_shared(self, session_id, cached):
+        """The session as last saved by any worker, reusing `cached` if it is current."""
+        version = self.backend.version(session_id)
+        if version is None:
+            # A saved session that is gone was discarded or expired elsewhere
+            return None if cached is not None and cached.version else cached
+        if cached is not None and cached.version == version:
+            return cached
+        entry = self.backend.load(session_id)
+        if entry is None:
+            return cached
+        self.shared_loads += 1
+        return self._from_record(session_id, entry[1], version=entry[0])
+
+    def _from_record(self, session_id, record, version=0):
+        data = json.loads(record)
+        memory = self.memory_factory().load_dict(data["memory"])
+        # Records written before FormState hold a flat "form_data" dict
+        form = FormState.from_dict(data["form"]) if "form" in data else FormState(data.get("form_data"))
+        return Session(session_id, memory, form=form, version=version, content_version=data.get("content_version"))
+
+    def _load_spilled(self, session_id):
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT record FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        self._db.commit()
+        self.spill_loads += 1
+        return self._from_record(session_id, row[0])
@@ -0,0 +1,114 @@
+from pathlib import Path
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from form_state import FormState, FormVersionConflict, has_meaningful_form_content
+from form_updates import parse_reply
+from schema_index import SchemaIndex
+
+SCHEMA = Path(__file__).resolve().parent.parent / "questions_schema.json"
+
+
+def test_patch_on_a_stale_version_raises():
+    form = FormState()
+    version = form.apply({"basicInfo.owner": "Bob"}, base_version=0)
+    assert version == 1
+    with pytest.raises(FormVersionConflict) as conflict:
+        form.apply({"basicInfo.owner": "Ann"}, base_version=0)
+    assert conflict.value.version == 1
+    assert form.values == {"basicInfo.owner": "Bob"}
+    # A whole-form replace needs no base version
+    assert form.apply({"basicInfo": {"owner": "Ann"}}, replace=True) == 2
+    assert form.values == {"basicInfo.owner": "Ann"}
+
+
+def test_nested_patches_are_flattened_and_empty_values_dropped():
+    form = FormState()
+    form.apply({"a": {"b": "x", "c": "", "d": [], "e": None}, "f": ["DEV"]})
+    assert form.values == {"a.b": "x", "f": ["DEV"]}
+    assert form.has_content
+    form.apply({"a.b": "  ", "f": None})
+    assert not form.has_content
+
+
+def test_false_and_zero_are_answers_not_cleared_fields():
+    form = FormState()
+    form.apply({"fileTransferInfo": {"hasOutbound": False, "hasInbound": True}, "a.count": 0})
+    assert form.values == {"fileTransferInfo.hasOutbound": False, "fileTransferInfo.hasInbound": True, "a.count": 0}
+    form.mark_sent(form.changes())
+    form.apply({"fileTransferInfo.hasInbound": False}, base_version=1)
+    assert form.changes() == {"fileTransferInfo.hasInbound": False}
+    # Only False answers still count as filled in, but not as a loaded draft
+    only_no = FormState()
+    only_no.apply({"existingFlows.isUsingIODS": False})
+    text, changes = only_no.prompt_context("is IODS used?")
+    assert text.startswith("Form: 1 field(s) filled.")
+    assert changes == {"existingFlows.isUsingIODS": False}
+    assert not only_no.has_content
+
+
+def test_false_from_a_tool_update_is_kept():
+    schema_index = SchemaIndex.from_json(SCHEMA.read_text())
+    response = AIMessage(content="", tool_calls=[
+        {"name": "update_form_field", "args": {"name": "fileTransferInfo.hasOutbound", "value": "no"}, "id": "1"},
+    ])
+    reply = parse_reply(response, schema_index)
+    assert reply.form_updates == [{"name": "fileTransferInfo.hasOutbound", "value": False}]
+    form = FormState()
+    updates = {update["name"]: update["value"] for update in reply.form_updates}
+    form.apply(updates)
+    form.mark_sent(updates)
+    assert form.values == {"fileTransferInfo.hasOutbound": False}
+    text, changes = form.prompt_context()
+    assert changes == {} and "null" not in text
+
+
+def test_cleared_field_shows_up_as_none_in_changes():
+    form = FormState()
+    form.apply({"a.b": "x", "a.c": "y"})
+    form.mark_sent(form.changes())
+    form.apply({"a.b": ""})
+    assert form.changes() == {"a.b": None}
+
+
+def test_mark_sent_then_changes_is_empty():
+    form = FormState()
+    form.apply({"a.b": "x"})
+    text, changes = form.prompt_context("what is b")
+    assert changes == {"a.b": "x"}
+    assert "a.b" in text
+    form.mark_sent(changes)
+    assert form.changes() == {}
+    form.forget_sent()
+    assert form.changes() == {"a.b": "x"}
+
+
+def test_prompt_context_includes_related_unchanged_fields_only():
+    form = FormState()
+    form.apply({"networkInfo.region": "NORTH", "networkInfo.subnet": "10.0.0.0/24", "businessInfo.owner": "Bob"})
+    form.mark_sent(form.changes())
+    text, changes = form.prompt_context("networkInfo.region")
+    assert changes == {}
+    assert "networkInfo.subnet" in text and "businessInfo.owner" not in text
+
+
+def test_round_trip_keeps_version_and_sent():
+    form = FormState()
+    form.apply({"a.b": "x"})
+    form.mark_sent({"a.b": "x"})
+    copy = FormState.from_dict(form.to_dict())
+    assert (copy.values, copy.version, copy.sent) == (form.values, form.version, form.sent)
+
+
+def test_meaningful_content():
+    assert not has_meaningful_form_content({"a": {"b": "", "c": [None, " "], "d": 0, "e": False}})
+    assert has_meaningful_form_content({"a": {"b": [0, "x"]}})
+
+
+def test_questions_match_field_names_not_sections():
+    form = FormState()
+    form.apply({"networkInfo.region": "NORTH", "businessInfo.owner": "Bob"})
+    form.mark_sent(form.changes())
+    text, _ = form.prompt_context("who is the owner of this info?")
+    assert "businessInfo.owner" in text and "networkInfo.region" not in text
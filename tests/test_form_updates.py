@@ -0,0 +1,105 @@
+from pathlib import Path
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from form_updates import FORM_UPDATE_TOOL, parse_reply
+from schema_index import SchemaIndex
+
+SCHEMA = Path(__file__).resolve().parent.parent / "questions_schema.json"
+
+
+@pytest.fixture(scope="module")
+def schema_index():
+    return SchemaIndex.from_json(SCHEMA.read_text())
+
+
+def tool_reply(content="", *updates):
+    """A model message calling update_form_field once per (name, value)."""
+    calls = [{"name": FORM_UPDATE_TOOL["name"], "args": {"name": name, "value": value}, "id": str(i)}
+             for i, (name, value) in enumerate(updates)]
+    return AIMessage(content=content, tool_calls=calls)
+
+
+@pytest.mark.parametrize("path, value, expected", [
+    ("applicationInfo.primaryRegion", "north", "NORTH"),
+    ("applicationInfo.internalOrExternal", " external ", "External"),
+    ("networkCloudInfo.networkLocation", "on site", "On Site"),
+    ("existingFlows.isUsingIODS", "yes", True),
+    ("fileTransferInfo.hasOutbound", "No", False),
+    ("fileTransferInfo.hasInbound", False, False),
+    ("applicationInfo.environments", "dev, prod,DEV", ["DEV", "PROD"]),
+    ("applicationInfo.environments", ["qa"], ["QA"]),
+    ("businessInfo.implementationDeadline", "2025-03-31", "2025-03-31"),
+    ("networkCloudInfo.cloudDetails.awsAccountNumber", "123456789012", "123456789012"),
+    ("networkCloudInfo.cloudDetails.ipOrSubnet", "10.0.0.0/24", "10.0.0.0/24"),
+    ("fileTransferInfo.sourceBucketArn", "arn:aws:s3:::my-bucket/in", "arn:aws:s3:::my-bucket/in"),
+    # Numeric segments from form arrays are ignored when looking up the field
+    ("applicationInfo.0.systemName", " Payroll ", "Payroll"),
+])
+def test_valid_values_are_normalized(schema_index, path, value, expected):
+    field, normalized = schema_index.validate(path, value)
+    assert normalized == expected
+    assert field.path == path.replace(".0", "")
+
+
+@pytest.mark.parametrize("path, value", [
+    ("applicationInfo.primaryRegion", "EAST"),
+    ("applicationInfo.environments", "DEV, STAGING"),
+    ("applicationInfo.environments", {"env": "DEV"}),
+    ("existingFlows.isUsingIODS", "maybe"),
+    ("businessInfo.implementationDeadline", "31/03/2025"),
+    ("businessInfo.implementationDeadline", "2025-02-30"),
+    ("networkCloudInfo.cloudDetails.awsAccountNumber", "123"),
+    ("networkCloudInfo.cloudDetails.ipOrSubnet", "ten.0.0.1"),
+    ("fileTransferInfo.sourceBucketArn", "my-bucket"),
+    ("applicationInfo.systemName", ["Payroll"]),
+    ("applicationInfo.systemName", None),
+    ("applicationInfo", "Payroll"),
+    ("applicationInfo.unknownField", "x"),
+])
+def test_invalid_values_are_rejected(schema_index, path, value):
+    with pytest.raises(ValueError):
+        schema_index.validate(path, value)
+
+
+def test_reply_keeps_valid_updates_and_rejects_the_rest(schema_index):
+    response = tool_reply(
+        "Got it.",
+        ("applicationInfo.primaryRegion", "south"),
+        ("applicationInfo.environments", "qa,prod"),
+        ("applicationInfo.backupRegion", "WEST"),
+        ("noSuch.field", "x"),
+    )
+    reply = parse_reply(response, schema_index)
+    assert reply.answer == "Got it."
+    assert reply.form_updates == [
+        {"name": "applicationInfo.primaryRegion", "value": "SOUTH"},
+        {"name": "applicationInfo.environments", "value": ["QA", "PROD"]},
+    ]
+    assert [args["name"] for args, _ in reply.rejected] == ["applicationInfo.backupRegion", "noSuch.field"]
+    assert "unknown field" in reply.rejected[1][1]
+    assert reply.memory_text().endswith("[Form updated: applicationInfo.environments = ['QA', 'PROD']]")
+
+
+def test_tool_only_reply_gets_confirmations_as_its_answer(schema_index):
+    response = tool_reply("", ("existingFlows.isUsingIODS", "no"),
+                          ("networkCloudInfo.cloudDetails.awsAccountNumber", "123456789012"))
+    reply = parse_reply(response, schema_index)
+    assert reply.form_updates[0] == {"name": "existingFlows.isUsingIODS", "value": False}
+    assert reply.answer.startswith("Perfect! Is using IODS?")
+    assert "123456789012" in reply.answer
+
+
+def test_rejected_only_reply_has_no_answer_and_other_tools_are_ignored(schema_index):
+    response = tool_reply("", ("applicationInfo.primaryRegion", "EAST"))
+    response.tool_calls.append({"name": "something_else", "args": {"name": "applicationInfo.systemName",
+                                                                   "value": "x"}, "id": "9"})
+    reply = parse_reply(response, schema_index)
+    assert reply.form_updates == [] and reply.answer == ""
+    assert len(reply.rejected) == 1
+
+
+def test_text_only_reply_has_no_updates(schema_index):
+    reply = parse_reply(AIMessage(content=[{"type": "text", "text": " Hello "}]), schema_index)
+    assert (reply.answer, reply.form_updates, reply.rejected) == ("Hello", [], [])
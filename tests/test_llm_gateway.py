@@ -0,0 +1,149 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from llm_gateway import CircuitOpenError, LLMGateway
+
+# Not retried, but a failure of the model rather than of the request
+SERVICE_ERROR = ValueError("Error raised by bedrock service: ModelErrorException")
+
+
+class StubModel:
+    """Answers after `delay` seconds, or raises `error` on every call."""
+
+    def __init__(self, answer="ok", delay=0.0, error=None):
+        self.answer = answer
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return AIMessage(content=self.answer)
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return AIMessage(content=self.answer)
+
+
+def gateway(**kwargs):
+    kwargs.setdefault("backoff_base", 0.001)
+    kwargs.setdefault("backoff_max", 0.001)
+    return LLMGateway(**kwargs)
+
+
+def test_identical_requests_in_flight_share_one_call():
+    model = StubModel(delay=0.05)
+    gw = gateway()
+    gw.set_models(model)
+
+    async def run():
+        return await asyncio.gather(gw.ainvoke([HumanMessage("hi")]), gw.ainvoke([HumanMessage("hi")]),
+                                    gw.ainvoke([HumanMessage("other")]))
+
+    responses = asyncio.run(run())
+    assert [r.content for r in responses] == ["ok", "ok", "ok"]
+    assert model.calls == 2
+
+
+def test_one_caller_timing_out_does_not_cancel_the_call_for_others():
+    model = StubModel(delay=0.1)
+    gw = gateway()
+    gw.set_models(model)
+
+    async def run():
+        impatient = asyncio.create_task(asyncio.wait_for(gw.ainvoke([HumanMessage("hi")]), 0.01))
+        patient = asyncio.create_task(gw.ainvoke([HumanMessage("hi")]))
+        with pytest.raises(asyncio.TimeoutError):
+            await impatient
+        return await patient
+
+    assert asyncio.run(run()).content == "ok"
+    assert model.calls == 1
+
+
+def test_call_is_cancelled_when_every_caller_gives_up():
+    throttled = StubModel(delay=0.01, error=ValueError("ThrottlingException: slow down"))
+    gw = gateway(max_concurrency=1, max_retries=50, backoff_base=0.02, backoff_max=0.02)
+    gw.set_models(throttled)
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(gw.ainvoke([HumanMessage("hi")]), 0.05)
+        calls = throttled.calls
+        await asyncio.sleep(0.1)
+        # No retries after the caller left, and the slot is free again
+        assert throttled.calls == calls
+        assert not gw._in_flight
+        gw.set_models(StubModel())
+        start = time.monotonic()
+        await gw.ainvoke([HumanMessage("next")])
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < 0.05
+
+
+def test_retryable_errors_are_retried():
+    model = StubModel(error=ValueError("Error raised by bedrock service: ThrottlingException"))
+    gw = gateway(max_retries=2)
+    gw.set_models(model)
+    with pytest.raises(ValueError):
+        gw.invoke([HumanMessage("hi")])
+    assert model.calls == 3
+
+
+def test_breaker_opens_and_fast_model_takes_over():
+    primary = StubModel(error=SERVICE_ERROR)
+    fast = StubModel(answer="fast")
+    gw = gateway(breaker_failures=2, breaker_reset_seconds=60)
+    gw.set_models(primary, fast)
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            gw.invoke([HumanMessage("hi")])
+    assert gw.primary.breaker.state == "open"
+    assert gw.invoke([HumanMessage("hi")]).content == "fast"
+    assert primary.calls == 2
+
+
+def test_breaker_open_without_fallback_raises():
+    gw = gateway(breaker_failures=1, breaker_reset_seconds=60)
+    gw.set_models(StubModel(error=SERVICE_ERROR))
+    with pytest.raises(ValueError):
+        gw.invoke([HumanMessage("hi")])
+    with pytest.raises(CircuitOpenError):
+        gw.invoke([HumanMessage("hi")])
+
+
+def test_half_open_breaker_closes_on_success():
+    model = StubModel(error=SERVICE_ERROR)
+    gw = gateway(breaker_failures=1, breaker_reset_seconds=0.01)
+    gw.set_models(model)
+    with pytest.raises(ValueError):
+        gw.invoke([HumanMessage("hi")])
+    time.sleep(0.02)
+    assert gw.primary.breaker.state == "half_open"
+    model.error = None
+    gw.invoke([HumanMessage("hi")])
+    assert gw.primary.breaker.state == "closed"
+
+
+def test_client_errors_do_not_open_the_breaker():
+    model = StubModel(error=ValueError("Error raised by bedrock service: ValidationException: input is too long"))
+    gw = gateway(breaker_failures=1, breaker_reset_seconds=60)
+    gw.set_models(model)
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            asyncio.run(gw.ainvoke([HumanMessage("hi")]))
+    assert gw.primary.breaker.state == "closed" and model.calls == 3
+    model.error = TimeoutError("read timed out")
+    with pytest.raises(TimeoutError):
+        gw.invoke([HumanMessage("hi")])
+    assert gw.primary.breaker.state == "open"
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+
+from session_store import SessionStore, SQLiteSessionBackend
+
+
+def shared_stores(tmp_path):
+    path = str(tmp_path / "state.db")
+    return SessionStore(backend=SQLiteSessionBackend(path)), SessionStore(backend=SQLiteSessionBackend(path))
+
+
+def test_concurrent_save_on_another_worker_is_not_lost(tmp_path):
+    a, b = shared_stores(tmp_path)
+    a.update("s1", lambda session: session.memory.save_turn("hi", "hello"))
+
+    calls = []
+
+    def add_turn(session):
+        # B saves while A's change is in progress (e.g. during an LLM call)
+        if not calls:
+            b.update("s1", lambda other: other.form.apply({"basicInfo.owner": "Bob"}))
+        calls.append(session)
+        session.memory.save_turn("next", "ok")
+
+    a.update("s1", add_turn)
+
+    session = b.get("s1")
+    assert session.form.values == {"basicInfo.owner": "Bob"}
+    assert [turn[0] for turn in session.memory.turns] == ["hi", "next"]
+    # Applied again to a reloaded copy, not to the stale one
+    assert len(calls) == 2 and calls[0] is not calls[1]
+    assert a.conflicts == 1
+
+
+def test_save_requires_the_loaded_version(tmp_path):
+    backend = SQLiteSessionBackend(str(tmp_path / "state.db"))
+    assert backend.save("s1", "{}", 0) == 1
+    assert backend.save("s1", "{}", 0) is None
+    assert backend.save("s1", "{}", 1) == 2
+    assert backend.save("s1", "{}", 1) is None
+
+
+def test_update_async_applies_each_change_once(tmp_path):
+    a, b = shared_stores(tmp_path)
+
+    async def run():
+        await asyncio.gather(*(a.update_async("s1", lambda session, i=i: session.memory.save_turn(f"q{i}", "a"))
+                               for i in range(5)))
+        await b.update_async("s1", lambda session: session.memory.save_turn("from b", "a"))
+        await a.update_async("s1", lambda session: session.memory.save_turn("last", "a"))
+
+    asyncio.run(run())
+    turns = [turn[0] for turn in b.get("s1").memory.turns]
+    assert sorted(turns[:5]) == [f"q{i}" for i in range(5)]
+    assert turns[5:] == ["from b", "last"]
+
+
+def test_fold_skips_turns_already_folded_elsewhere(tmp_path):
+    a, b = shared_stores(tmp_path)
+    for i in range(3):
+        a.update("s1", lambda session, i=i: session.memory.save_turn(f"q{i}", "a"))
+    claimed = list(a.get("s1").memory.turns[:2])
+    b.update("s1", lambda session: session.memory.fold(claimed, "b's summary"))
+    a.update("s1", lambda session: session.memory.fold(claimed, "a's summary"))
+
+    memory = a.get("s1").memory
+    assert [turn[0] for turn in memory.turns] == ["q2"]
+    assert memory.summary == "b's summary"
+
+
+def test_spill_io_runs_off_the_event_loop(tmp_path):
+    store = SessionStore(max_sessions=1, spill_path=str(tmp_path / "spill.db"))
+    io_threads = []
+    for name in ("_evict", "_load_spilled"):
+        method = getattr(store, name)
+
+        def record_thread(session_id, method=method):
+            io_threads.append(threading.current_thread())
+            return method(session_id)
+
+        setattr(store, name, record_thread)
+
+    async def run():
+        await store.update_async("s1", lambda session: session.memory.save_turn("hi", "hello"))
+        await store.get_async("s2")
+        return await store.get_async("s1")
+
+    session = asyncio.run(run())
+    assert [turn[0] for turn in session.memory.turns] == ["hi"]
+    assert store.evictions == 2 and store.spill_loads == 1
+    assert io_threads and threading.main_thread() not in io_threads